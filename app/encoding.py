@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from core.config import settings
+from .streaming import json_default
+
+logger = logging.getLogger(__name__)
+
+# Encodeurs optionnels : chacun n'est proposé que s'il est installé
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+class NotAcceptable(Exception):
+    """Encodage demandé mais indisponible sur ce serveur"""
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Choisit l'encodage de la réponse d'après l'en-tête Accept (JSON par défaut)"""
+    accept = (accept or "").lower()
+    if ARROW_MEDIA_TYPE in accept:
+        return ARROW_MEDIA_TYPE
+    for media_type in MSGPACK_MEDIA_TYPES:
+        if media_type in accept:
+            return media_type
+    return JSON_MEDIA_TYPE
+
+def negotiate_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Choisit la compression d'après Accept-Encoding : brotli si disponible, sinon gzip"""
+    accepted = {token.split(";")[0].strip() for token in (accept_encoding or "").lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def encode_json(payload: Any) -> bytes:
+    """Sérialise en JSON avec orjson si disponible"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, default=json_default).encode("utf-8")
+
+def encode_msgpack(payload: Any) -> bytes:
+    if msgpack is None:
+        raise NotAcceptable("MessagePack indisponible (paquet msgpack non installé)")
+    return msgpack.packb(payload, default=json_default, use_bin_type=True)
+
+def _flatten(value: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    row = {}
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if isinstance(item, dict):
+            row.update(_flatten(item, f"{name}."))
+        elif item is None or isinstance(item, (bool, int, float, str)):
+            row[name] = item
+        else:
+            row[name] = str(json_default(item))
+    return row
+
+def encode_arrow(payload: Dict[str, Any]) -> bytes:
+    """
+    Encode la table des incidents en flux Arrow IPC (une ligne par incident,
+    champs imbriqués aplatis : details.hostname, scores.contextual_score...).
+    Le reste du rapport est transmis en JSON dans les métadonnées du schéma (clé report).
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise NotAcceptable("Arrow indisponible (paquet pyarrow non installé)")
+    if not isinstance(payload, dict) or "incidents" not in payload:
+        raise NotAcceptable("Arrow n'est disponible que pour les rapports")
+
+    rows: List[Dict[str, Any]] = [_flatten(incident) for incident in payload["incidents"]]
+    columns = list(dict.fromkeys(name for row in rows for name in row))
+    # Valeurs hétérogènes d'une colonne (ex. created_time) ramenées en texte
+    for name in columns:
+        types = {type(row.get(name)) for row in rows} - {type(None)}
+        if len(types) > 1 and not types <= {int, float}:
+            for row in rows:
+                if row.get(name) is not None:
+                    row[name] = str(row[name])
+    table = pa.Table.from_pylist(rows) if rows else pa.table({})
+    header = {key: value for key, value in payload.items() if key != "incidents"}
+    table = table.replace_schema_metadata({"report": encode_json(header)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def encode_body(payload: Any, media_type: str) -> bytes:
+    if media_type == ARROW_MEDIA_TYPE:
+        return encode_arrow(payload)
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return encode_msgpack(payload)
+    return encode_json(payload)
+
+def compress(body: bytes, content_encoding: str) -> bytes:
+    if content_encoding == "br":
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL)
+
+def make_etag(*parts: Any) -> str:
+    """ETag faible dérivé de parties stables (identifiant, horodatage, variante)"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Vrai si l'ETag figure dans If-None-Match (comparaison faible)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept, Accept-Encoding"})
+
+def encoded_response(request: Request, payload: Any, etag: Optional[str] = None,
+                     status_code: int = 200) -> Response:
+    """
+    Encode une réponse selon les en-têtes du client : JSON (orjson), MessagePack
+    ou Arrow IPC d'après Accept, compression brotli/gzip d'après Accept-Encoding
+    au-delà de RESPONSE_COMPRESSION_MIN_BYTES
+    """
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    try:
+        body = encode_body(payload, media_type)
+    except NotAcceptable as e:
+        return Response(content=str(e), status_code=406, media_type="text/plain")
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+    content_encoding = negotiate_content_encoding(request.headers.get("accept-encoding"))
+    if content_encoding and len(body) >= settings.RESPONSE_COMPRESSION_MIN_BYTES:
+        body = compress(body, content_encoding)
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
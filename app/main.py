@@ -1,14 +1,68 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+import logging
+import sys
+from contextlib import asynccontextmanager
+from functools import partial
+from datetime import date
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query, BackgroundTasks, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from bson import ObjectId
 from .database import collection
-from ml.model.predictor import predict_from_file
+from .encoding import encoded_response, etag_matches, make_etag, negotiate_media_type, not_modified
+from .realtime import MicroBatcher
+from .reports import persist_full_report, persist_report
+from .rollups import top_keys, timeline, DIMENSIONS, TOTAL_DIMENSION
+from .uploads import UploadCreate, UploadSpool
+from .watcher import DirectoryWatcher, process_file
+from .streaming import NDJSON_MEDIA_TYPE, ndjson_report_stream, wants_ndjson
+from ml.model.loader import model_state
+from core.config import settings
 import dotenv
 import os
 
 dotenv.load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+def _predictor():
+    """
+    Import différé du pipeline ML : pandas, scikit-learn, scipy et openpyxl ne
+    sont chargés qu'au warm-up, pour que le processus écoute au plus vite
+    """
+    from ml.model import predictor
+    return predictor
+
+def _warm_up():
+    try:
+        _predictor().warm_up()
+    except Exception as e:
+        logger.error(f"Warm-up du modèle impossible: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Le warm-up tourne en arrière-plan : /healthz répond immédiatement,
+    # /readyz passe à ready une fois le modèle chargé et chauffé
+    warm_up_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+    # Ingestion du répertoire surveillé dans le même processus si WATCH_DIR est défini
+    watch_task = None
+    if settings.WATCH_DIR:
+        app.state.watcher = DirectoryWatcher(process_file)
+        watch_task = asyncio.create_task(app.state.watcher.run())
+    yield
+    if watch_task is not None:
+        app.state.watcher.stop()
+        await watch_task
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+    if 'ml.model.parallel' in sys.modules:
+        sys.modules['ml.model.parallel'].shutdown_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+# Limite utilisée par $slice lorsque seul un offset est fourni
+MAX_PAGE_SIZE = 2**31 - 1
 
 # Pour autoriser l'appel depuis un frontend (Streamlit, React, etc.)
 app.add_middleware(
@@ -19,35 +73,201 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness : le processus répond"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness : prêt uniquement une fois le modèle chargé et chauffé"""
+    status_code = 200 if model_state["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=model_state)
+
+@app.get("/ingest/watch/metrics")
+async def watch_metrics(request: Request):
+    """Débit et retard du service d'ingestion du répertoire surveillé"""
+    watcher = getattr(request.app.state, "watcher", None)
+    if watcher is None:
+        raise HTTPException(status_code=404, detail="Surveillance de répertoire désactivée (WATCH_DIR)")
+    return watcher.metrics()
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                  top_k: Optional[int] = Query(None, ge=1), flat: bool = False):
+    # flat=true : un incident par ligne au lieu des incidents regroupés
+    group = False if flat else None
+    # Lecture, prétraitement, prédiction et scoring hors de la boucle d'événements :
+    # /healthz, le WebSocket d'ingestion et le watcher restent réactifs
     try:
-        report = predict_from_file(file)
+        if wants_ndjson(request.headers.get("accept")):
+            # Réponse en flux : en-tête puis incidents par ordre de criticité
+            header, incidents, build_full_report = await asyncio.to_thread(
+                _predictor().stream_from_file, file, group)
+            header['fileName'] = file.filename
+            # Enregistrement lancé tout de suite, indépendamment de la lecture du flux
+            persisted = asyncio.get_running_loop().run_in_executor(
+                None, persist_full_report, ObjectId(), file.filename, build_full_report)
+            return StreamingResponse(
+                ndjson_report_stream(header, incidents, persisted),
+                media_type=NDJSON_MEDIA_TYPE
+            )
+        if top_k is not None:
+            # Seuls les K incidents les plus critiques sont renvoyés, le rapport
+            # complet est enregistré en tâche de fond sous le même identifiant
+            report, build_full_report = await asyncio.to_thread(
+                _predictor().predict_top_k_from_file, file, top_k, group)
+            report_id = ObjectId()
+            report['fileName'] = file.filename
+            report['_id'] = str(report_id)
+            background_tasks.add_task(persist_full_report, report_id, file.filename, build_full_report)
+            return encoded_response(request, report)  # La tâche de fond reste attachée à la réponse
+        report = await asyncio.to_thread(_predictor().predict_from_file, file, group)
         report['fileName'] = file.filename
-        result = collection.insert_one(report)  # Enregistrer le rapport dans MongoDB
-        report['_id'] = str(result.inserted_id)
-        return report  # Le report est déjà un JSON
+        report['_id'] = await asyncio.to_thread(persist_report, report)  # Enregistrer le rapport dans MongoDB
+        return encoded_response(request, report)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request, files: List[UploadFile] = File(...), flat: bool = False):
+    try:
+        report = await asyncio.to_thread(_predictor().predict_from_files, files, False if flat else None)
+        report['fileName'] = ", ".join(file.filename for file in files)
+        report['_id'] = await asyncio.to_thread(persist_report, report)  # Un seul rapport combiné pour tout le lot
+        return encoded_response(request, report)
+    except Exception as e:
+        status_code = 413 if isinstance(e, _predictor().ArchiveTooLarge) else 400
+        raise HTTPException(status_code=status_code, detail=str(e))
+
+@app.websocket("/ws/ingest")
+async def ingest(websocket: WebSocket):
+    """Ingestion temps réel : alertes en JSON lines, incidents scorés renvoyés par micro-batch"""
+    await websocket.accept()
+    predictor = _predictor()
+    # Bornes de normalisation propres à la connexion : scores comparables d'un micro-batch à l'autre
+    score_bounds = predictor.RunningScoreBounds()
+    await MicroBatcher(websocket, partial(predictor.predict_records, score_bounds=score_bounds)).run()
+
+_upload_spool: Optional[UploadSpool] = None
+
+def _spool() -> UploadSpool:
+    global _upload_spool
+    if _upload_spool is None:
+        _upload_spool = UploadSpool()
+    return _upload_spool
+
+@app.post("/uploads")
+async def create_upload(upload: UploadCreate):
+    """Ouvre un upload reprenable et retourne son identifiant (offset 0)"""
+    return _spool().create(upload.filename, upload.size, upload.sha256)
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """État d'un upload : offset à partir duquel reprendre"""
+    return _spool().get(upload_id)
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(request: Request, upload_id: str, offset: int = Query(..., ge=0)):
+    """Ajoute un bloc (corps brut de la requête) à l'offset donné, vérifié par X-Chunk-SHA256"""
+    return await _spool().append(upload_id, offset, request.stream(),
+                                 request.headers.get("x-chunk-sha256"))
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(request: Request, upload_id: str, sha256: Optional[str] = None, flat: bool = False):
+    """Termine l'upload et analyse le fichier spoolé en flux, sans le charger en mémoire"""
+    spool = _spool()
+    state = await asyncio.to_thread(spool.finalize, upload_id, sha256)
+    try:
+        report = await asyncio.to_thread(
+            _predictor().predict_from_path, spool.data_path(upload_id), state["filename"],
+            False if flat else None
+        )
+        report['fileName'] = state["filename"]
+        report['_id'] = await asyncio.to_thread(persist_report, report)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    spool.delete(upload_id)
+    return encoded_response(request, report)
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    _spool().get(upload_id)
+    _spool().delete(upload_id)
+    return {"status": "deleted"}
 
 @app.get("/history")
-async def get_history():
+async def get_history(request: Request):
     try:
         history = list(collection.find({}, {"_id": 1, "fileName": 1, "timestamp": 1, "summary": 1}))
         # Convertir _id en string
         for item in history:
             item['_id'] = str(item['_id'])
-        return history
+        return encoded_response(request, history)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/history/{report_id}")
-async def get_report(report_id: str):
+async def get_report(request: Request, report_id: str, top_k: Optional[int] = Query(None, ge=1),
+                     offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
     try:
-        report = collection.find_one({"_id": ObjectId(report_id)})
+        # Les rapports stockés ne changent pas : l'ETag dépend de l'identifiant, de
+        # l'horodatage et de la variante demandée, et se vérifie sans charger le rapport
+        stored = collection.find_one({"_id": ObjectId(report_id)}, {"timestamp": 1})
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Report not found")
+        etag = make_etag(report_id, stored.get('timestamp'), negotiate_media_type(request.headers.get("accept")),
+                         top_k, offset, limit)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        # Les incidents stockés sont déjà triés par criticité : le top-K et les
+        # pages sont lus directement avec $slice, sans charger tout le rapport
+        page_size = limit or top_k
+        paginated = page_size is not None or offset > 0
+        projection = None
+        if paginated:
+            projection = {"incidents": {"$slice": [offset, page_size or MAX_PAGE_SIZE]}}
+        report = collection.find_one({"_id": ObjectId(report_id)}, projection)
         if report:
             report['_id'] = str(report['_id'])
-            return report
+            if paginated:
+                report['pagination'] = {
+                    "offset": offset,
+                    "limit": page_size,
+                    "returned": len(report.get('incidents', [])),
+                    "total": report.get('summary', {}).get(
+                        'unique_incidents', report.get('summary', {}).get('total_incidents', 0)
+                    )
+                }
+            return encoded_response(request, report, etag=etag)
         raise HTTPException(status_code=404, detail="Report not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+ROLLUP_DIMENSIONS = list(DIMENSIONS) + [TOTAL_DIMENSION]
+
+def _check_dimension(dimension: str):
+    if dimension not in ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Dimension inconnue: {dimension} ({', '.join(ROLLUP_DIMENSIONS)})")
+
+@app.get("/analytics/top/{dimension}")
+async def get_top_rollups(dimension: str, start: Optional[date] = None, end: Optional[date] = None,
+                          days: int = Query(30, ge=1), limit: int = Query(10, ge=1, le=1000)):
+    _check_dimension(dimension)
+    try:
+        return {"dimension": dimension, "items": top_keys(dimension, start, end, days, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/timeline/{dimension}")
+async def get_rollup_timeline(dimension: str, key: str, start: Optional[date] = None,
+                              end: Optional[date] = None, days: int = Query(30, ge=1)):
+    _check_dimension(dimension)
+    try:
+        return {"dimension": dimension, "key": key, "days": timeline(dimension, key, start, end, days)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
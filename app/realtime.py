@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from core.config import settings
+from .streaming import json_default
+
+logger = logging.getLogger(__name__)
+
+# Marque la fin du flux dans la file d'attente
+_END = object()
+
+class MicroBatcher:
+    """
+    Regroupe les alertes reçues sur un WebSocket en micro-batches (par taille ou
+    par délai), les analyse et renvoie les incidents scorés sur le même socket.
+
+    Le client envoie des messages texte contenant une ou plusieurs alertes au
+    format JSON lines. Les alertes passent par une file bornée : quand le modèle
+    ne suit pas, la file se remplit, la lecture du socket est suspendue et la
+    contre-pression remonte jusqu'au client via TCP.
+    """
+
+    def __init__(self, websocket: WebSocket,
+                 process_batch: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[int] = None,
+                 queue_size: Optional[int] = None):
+        """
+        Args:
+            websocket: WebSocket déjà accepté
+            process_batch: Fonction (bloquante) analysant une liste d'alertes
+            batch_size: Taille maximale d'un micro-batch (INGEST_BATCH_SIZE)
+            max_wait_ms: Délai maximal d'attente d'un micro-batch (INGEST_MAX_WAIT_MS)
+            queue_size: Nombre maximal d'alertes en attente (INGEST_QUEUE_SIZE)
+        """
+        self.websocket = websocket
+        self.process_batch = process_batch
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.max_wait = (max_wait_ms or settings.INGEST_MAX_WAIT_MS) / 1000
+        self.queue = asyncio.Queue(maxsize=queue_size or settings.INGEST_QUEUE_SIZE)
+        self.batches_sent = 0
+        self._receiving = True
+
+    async def run(self):
+        """Traite le flux jusqu'à la déconnexion du client"""
+        receiver = asyncio.create_task(self._receive())
+        try:
+            await self._batch_loop()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+
+    async def _send(self, message: Dict[str, Any]):
+        await self.websocket.send_text(json.dumps(message, ensure_ascii=False, default=json_default))
+
+    async def _receive(self):
+        """Lit les messages JSON lines et alimente la file (bloque si elle est pleine)"""
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                for line in text.splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        await self._send({"type": "error", "detail": f"Ligne JSON invalide: {e}"})
+                        continue
+                    if not isinstance(record, dict):
+                        await self._send({"type": "error", "detail": "Chaque ligne doit être un objet JSON"})
+                        continue
+                    await self.queue.put((record, time.monotonic()))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Jamais d'attente ici : après une annulation, plus personne ne lit la file.
+            # Si elle est pleine, _batch_loop s'arrête une fois la file vidée (_receiving)
+            self._receiving = False
+            try:
+                self.queue.put_nowait(_END)
+            except asyncio.QueueFull:
+                pass
+
+    async def _next(self, timeout: Optional[float] = None):
+        """Prochain élément de la file, _END si la réception est terminée et la file vide"""
+        if not self._receiving and self.queue.empty():
+            return _END
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    async def _batch_loop(self):
+        """Constitue les micro-batches par taille ou par délai et les traite"""
+        loop = asyncio.get_running_loop()
+        closed = False
+        while not closed:
+            item = await self._next()
+            if item is _END:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await self._next(timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _END:
+                    closed = True
+                    break
+                batch.append(item)
+            await self._process(batch)
+
+    async def _process(self, batch: list):
+        """Analyse un micro-batch hors de la boucle d'évènements et renvoie les incidents"""
+        self.batches_sent += 1
+        records = [record for record, _ in batch]
+        oldest = min(received_at for _, received_at in batch)
+        try:
+            incidents = await asyncio.to_thread(self.process_batch, records)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'analyse du micro-batch {self.batches_sent}: {e}")
+            await self._send({"type": "error", "batch_id": self.batches_sent,
+                              "records": len(records), "detail": str(e)})
+            return
+        await self._send({
+            "type": "batch",
+            "batch_id": self.batches_sent,
+            "records": len(records),
+            "incidents": incidents,
+            "latency_ms": round((time.monotonic() - oldest) * 1000, 1),
+            "queue_depth": self.queue.qsize()
+        })
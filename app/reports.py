@@ -0,0 +1,25 @@
+import logging
+from typing import Any, Callable, Dict
+from bson import ObjectId
+from .database import collection
+from .rollups import update_rollups
+
+logger = logging.getLogger(__name__)
+
+def persist_report(report: Dict[str, Any]) -> str:
+    """Enregistre un rapport dans MongoDB, met à jour les rollups et retourne son identifiant"""
+    result = collection.insert_one(report)
+    try:
+        update_rollups(report)
+    except Exception as e:
+        # Les rollups se reconstruisent avec `python -m app.rollups backfill`
+        logger.error(f"Erreur lors de la mise à jour des rollups: {e}")
+    return str(result.inserted_id)
+
+def persist_full_report(report_id: ObjectId, file_name: str,
+                        build_full_report: Callable[[], Dict[str, Any]]) -> str:
+    """Construit et enregistre le rapport complet d'une réponse top-K ou NDJSON (hors requête)"""
+    report = build_full_report()
+    report['_id'] = report_id
+    report['fileName'] = file_name
+    return persist_report(report)
@@ -0,0 +1,200 @@
+import argparse
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import ASCENDING, UpdateOne
+from core.config import settings
+from .database import db, collection
+
+logger = logging.getLogger(__name__)
+
+rollups = db[settings.ROLLUP_COLLECTION_NAME]
+
+# Dimension -> chemin du champ dans un incident du rapport
+DIMENSIONS = {
+    "host": ("details", "hostname"),
+    "ioc_type": ("details", "ioc_type"),
+    "feed": ("details", "feed_name"),
+    "criticality": ("criticality_level",),
+}
+# Dimension des totaux par jour (clés "reports" et "incidents")
+TOTAL_DIMENSION = "total"
+
+_indexes_ready = False
+
+def create_indexes(target):
+    """Crée l'index unique (dimension, day, key) des compteurs"""
+    target.create_index(
+        [("dimension", ASCENDING), ("day", ASCENDING), ("key", ASCENDING)],
+        unique=True
+    )
+
+def ensure_indexes():
+    """Crée l'index des rollups une seule fois par processus"""
+    global _indexes_ready
+    if not _indexes_ready:
+        create_indexes(rollups)
+        _indexes_ready = True
+
+def report_day(report: Dict[str, Any]) -> str:
+    """Jour (YYYY-MM-DD) auquel un rapport est rattaché"""
+    try:
+        return datetime.fromisoformat(str(report["timestamp"])).date().isoformat()
+    except (KeyError, ValueError):
+        return date.today().isoformat()
+
+def _get_path(incident: Dict[str, Any], path: Tuple[str, ...]) -> str:
+    value = incident
+    for field in path:
+        if not isinstance(value, dict):
+            return "Unknown"
+        value = value.get(field)
+    return "Unknown" if value is None else str(value)
+
+def count_report(report: Dict[str, Any], counters: Optional[Counter] = None) -> Counter:
+    """
+    Ajoute les compteurs d'un rapport à counters
+
+    Returns:
+        Counter indexé par (day, dimension, key)
+    """
+    counters = Counter() if counters is None else counters
+    day = report_day(report)
+    incidents = report.get("incidents") or []
+    counters[(day, TOTAL_DIMENSION, "reports")] += 1
+    for incident in incidents:
+        # Un incident regroupé compte pour toutes ses occurrences
+        weight = int(incident.get("occurrences") or 1)
+        counters[(day, TOTAL_DIMENSION, "incidents")] += weight
+        for dimension, path in DIMENSIONS.items():
+            counters[(day, dimension, _get_path(incident, path))] += weight
+    return counters
+
+def apply_counters(counters: Counter, target=None):
+    """Incrémente les compteurs pré-agrégés en une seule écriture groupée"""
+    if not counters:
+        return
+    if target is None:
+        ensure_indexes()
+        target = rollups
+    operations = [
+        UpdateOne(
+            {"dimension": dimension, "day": day, "key": key},
+            {"$inc": {"count": count}},
+            upsert=True
+        )
+        for (day, dimension, key), count in counters.items()
+    ]
+    target.bulk_write(operations, ordered=False)
+
+def update_rollups(report: Dict[str, Any]):
+    """Met à jour les rollups avec un rapport qui vient d'être inséré"""
+    apply_counters(count_report(report))
+
+def _day_range(start: Optional[date], end: Optional[date], days: int) -> Tuple[str, str]:
+    end = end or date.today()
+    start = start or end - timedelta(days=days - 1)
+    return start.isoformat(), end.isoformat()
+
+def top_keys(dimension: str, start: Optional[date] = None, end: Optional[date] = None,
+             days: int = 30, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Clés les plus fréquentes d'une dimension sur une période
+
+    Args:
+        dimension: host, ioc_type, feed, criticality ou total
+        start, end: Bornes incluses (par défaut les `days` derniers jours)
+        limit: Nombre de clés retournées
+    """
+    first_day, last_day = _day_range(start, end, days)
+    pipeline = [
+        {"$match": {"dimension": dimension, "day": {"$gte": first_day, "$lte": last_day}}},
+        {"$group": {"_id": "$key", "count": {"$sum": "$count"}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+    return [{"key": item["_id"], "count": item["count"]} for item in rollups.aggregate(pipeline)]
+
+def timeline(dimension: str, key: str, start: Optional[date] = None, end: Optional[date] = None,
+             days: int = 30) -> List[Dict[str, Any]]:
+    """Compteurs jour par jour d'une clé sur une période"""
+    first_day, last_day = _day_range(start, end, days)
+    cursor = rollups.find(
+        {"dimension": dimension, "key": key, "day": {"$gte": first_day, "$lte": last_day}},
+        {"_id": 0, "day": 1, "count": 1}
+    ).sort("day", ASCENDING)
+    return list(cursor)
+
+def _rollup_projection() -> Dict[str, int]:
+    """Champs d'un rapport nécessaires au calcul des rollups"""
+    projection = {"timestamp": 1, "incidents.occurrences": 1}
+    for path in DIMENSIONS.values():
+        projection["incidents." + ".".join(path)] = 1
+    return projection
+
+def _replay_missed(seen: set) -> int:
+    """
+    Applique aux rollups reconstruits les rapports absents du parcours initial
+    (insérés pendant le backfill : leurs compteurs sont partis avec l'ancienne collection)
+    """
+    missed = [item["_id"] for item in collection.find({}, {"_id": 1}) if item["_id"] not in seen]
+    counters = Counter()
+    for start in range(0, len(missed), 1000):
+        for report in collection.find({"_id": {"$in": missed[start:start + 1000]}}, _rollup_projection()):
+            count_report(report, counters)
+    apply_counters(counters)
+    return len(missed)
+
+def backfill(reports: Optional[Iterable[Dict[str, Any]]] = None) -> int:
+    """
+    Reconstruit entièrement les rollups à partir des rapports existants
+
+    Sans `reports`, la collection des rapports est parcourue pendant que
+    l'ingestion continue : les identifiants vus sont mémorisés et les rapports
+    insérés entre le parcours et la bascule sont rejoués après celle-ci. Un
+    rapport dont la mise à jour des rollups chevauche exactement la bascule
+    peut rester compté deux fois ; pour un résultat exact, arrêter l'ingestion.
+
+    Returns:
+        Nombre de rapports traités
+    """
+    replay = reports is None
+    if replay:
+        reports = collection.find({}, _rollup_projection())
+
+    counters = Counter()
+    seen = set()
+    processed = 0
+    for report in reports:
+        count_report(report, counters)
+        seen.add(report.get("_id"))
+        processed += 1
+
+    # Construction dans une collection temporaire puis bascule atomique
+    staging = db[f"{settings.ROLLUP_COLLECTION_NAME}_backfill"]
+    staging.drop()
+    create_indexes(staging)
+    apply_counters(counters, target=staging)
+    if counters:
+        staging.rename(settings.ROLLUP_COLLECTION_NAME, dropTarget=True)
+    else:
+        rollups.delete_many({})
+    if replay:
+        missed = _replay_missed(seen)
+        processed += missed
+        if missed:
+            logger.info(f"{missed} rapports insérés pendant le backfill rejoués après la bascule")
+    logger.info(f"Rollups reconstruits à partir de {processed} rapports ({len(counters)} compteurs)")
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestion des rollups analytiques")
+    parser.add_argument("command", choices=["backfill"], help="backfill : reconstruit les rollups")
+    args = parser.parse_args()
+    if args.command == "backfill":
+        processed = backfill()
+        print(f"Rollups reconstruits à partir de {processed} rapports")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator
+
+from starlette.concurrency import iterate_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def wants_ndjson(accept: str) -> bool:
+    """Indique si le client a demandé une réponse NDJSON via l'en-tête Accept"""
+    return NDJSON_MEDIA_TYPE in (accept or "")
+
+def json_default(value: Any) -> Any:
+    """Convertit les types numpy/pandas/datetime non sérialisables en JSON"""
+    if hasattr(value, "item"):
+        return value.item()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def _ndjson_line(obj: Dict[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False, default=json_default) + "\n").encode("utf-8")
+
+async def ndjson_report_stream(header: Dict[str, Any], incidents: Iterator[Dict[str, Any]],
+                               persisted: Awaitable[str]) -> AsyncIterator[bytes]:
+    """
+    Diffuse un rapport en NDJSON : une ligne d'en-tête (summary, analytics),
+    puis une ligne par incident dans l'ordre de criticité, puis une ligne de fin.
+    L'enregistrement du rapport complet est lancé avant le flux et ne dépend pas
+    du client : s'il ferme la connexion, le rapport est tout de même persisté.
+    La ligne de fin confirme l'enregistrement et transmet l'identifiant du rapport.
+
+    Args:
+        header: En-tête du rapport (sans la liste des incidents)
+        incidents: Itérateur paresseux des incidents triés
+        persisted: Enregistrement en cours du rapport complet, retourne son _id
+    """
+    yield _ndjson_line({"type": "header", **header})
+
+    unique_incidents = 0
+    async for incident in iterate_in_threadpool(incidents):
+        unique_incidents += 1
+        yield _ndjson_line({"type": "incident", **incident})
+
+    try:
+        # shield : une déconnexion du client n'annule pas l'enregistrement
+        report_id = await asyncio.shield(persisted)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'enregistrement du rapport: {e}")
+        yield _ndjson_line({"type": "error", "detail": str(e)})
+        return
+    # Entrées du rapport ; summary.total_incidents compte les occurrences
+    yield _ndjson_line({"type": "end", "_id": report_id, "unique_incidents": unique_incidents})
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import HTTPException
+from pydantic import BaseModel
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+# Les blocs reçus sont regroupés avant écriture pour limiter les allers-retours vers les threads
+_WRITE_BUFFER_BYTES = 1024 * 1024
+
+def _write_block(f, digest, data: bytes):
+    digest.update(data)
+    f.write(data)
+
+def _sync_file(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+class UploadCreate(BaseModel):
+    """Ouverture d'un upload reprenable"""
+    filename: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+class UploadSpool:
+    """
+    Spool disque des uploads reprenables
+
+    Chaque upload est un fichier <id>.part complété par des PUT successifs à un
+    offset donné, et un fichier d'état <id>.json (offset courant, taille et
+    empreinte attendues) réécrit atomiquement après chaque bloc. Un client
+    interrompu relit l'offset et reprend là où il s'était arrêté.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or settings.UPLOAD_SPOOL_DIR
+        os.makedirs(self.root, exist_ok=True)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.part")
+
+    def _state_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, f"{upload_id}.json")
+
+    def _save(self, state: Dict[str, Any]):
+        # Écriture atomique : l'état n'est jamais lu à moitié écrit
+        path = self._state_path(state["upload_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise HTTPException(status_code=404, detail="Upload not found")
+        try:
+            with open(self._state_path(upload_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+    def create(self, filename: str, size: Optional[int] = None,
+               sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Ouvre un nouvel upload et retourne son état (offset 0)"""
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail="Format de fichier non supporté (CSV, XLSX)")
+        if size is not None and size > settings.UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Fichier trop volumineux (max {settings.UPLOAD_MAX_BYTES} octets)")
+        self.purge_expired()
+        now = time.time()
+        state = {
+            "upload_id": uuid.uuid4().hex,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "offset": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        open(self.data_path(state["upload_id"]), "wb").close()
+        self._save(state)
+        return state
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                     chunk_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Écrit un bloc à l'offset donné, qui doit être l'offset courant de l'upload.
+        Le bloc est écrit au fil de la réception, vérifié (X-Chunk-SHA256) puis
+        synchronisé sur disque avant d'avancer l'offset ; en cas d'erreur le
+        fichier est tronqué à l'offset précédent.
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            state = self.get(upload_id)
+            if offset != state["offset"]:
+                raise HTTPException(status_code=409, detail={
+                    "message": "Offset inattendu, reprendre à l'offset courant",
+                    "offset": state["offset"]
+                })
+
+            digest = hashlib.sha256()
+            written = 0
+            limit = state["size"] if state["size"] is not None else settings.UPLOAD_MAX_BYTES
+            # Écriture, empreinte, fsync et troncature dans des threads : la boucle
+            # d'événements ne bloque jamais sur le disque
+            f = await asyncio.to_thread(open, self.data_path(upload_id), "r+b")
+            try:
+                await asyncio.to_thread(f.seek, offset)
+                buffer = bytearray()
+                try:
+                    async for chunk in chunks:
+                        written += len(chunk)
+                        if offset + written > limit:
+                            raise HTTPException(status_code=413, detail="Le bloc dépasse la taille annoncée")
+                        buffer += chunk
+                        if len(buffer) >= _WRITE_BUFFER_BYTES:
+                            await asyncio.to_thread(_write_block, f, digest, bytes(buffer))
+                            buffer.clear()
+                    if buffer:
+                        await asyncio.to_thread(_write_block, f, digest, bytes(buffer))
+                    if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                        raise HTTPException(status_code=422, detail="Empreinte SHA-256 du bloc invalide")
+                    await asyncio.to_thread(_sync_file, f)
+                except BaseException:
+                    await asyncio.to_thread(f.truncate, offset)
+                    raise
+                await asyncio.to_thread(f.truncate, offset + written)
+            finally:
+                await asyncio.to_thread(f.close)
+
+            state["offset"] = offset + written
+            state["updated_at"] = time.time()
+            await asyncio.to_thread(self._save, state)
+            return state
+
+    def finalize(self, upload_id: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Vérifie qu'un upload est complet (taille et empreinte) avant l'analyse.
+        Relit tout le fichier spoolé : à appeler hors de la boucle d'événements.
+        """
+        state = self.get(upload_id)
+        if state["size"] is not None and state["offset"] != state["size"]:
+            raise HTTPException(status_code=409, detail={
+                "message": "Upload incomplet",
+                "offset": state["offset"],
+                "size": state["size"]
+            })
+        expected = (sha256 or state["sha256"] or "").lower()
+        if expected:
+            digest = hashlib.sha256()
+            with open(self.data_path(upload_id), "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != expected:
+                raise HTTPException(status_code=422, detail="Empreinte SHA-256 du fichier invalide")
+        return state
+
+    def delete(self, upload_id: str):
+        for path in (self.data_path(upload_id), self._state_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._locks.pop(upload_id, None)
+
+    def purge_expired(self):
+        """Supprime les uploads inactifs depuis plus de UPLOAD_TTL_HOURS"""
+        deadline = time.time() - settings.UPLOAD_TTL_HOURS * 3600
+        for name in os.listdir(self.root):
+            upload_id, extension = os.path.splitext(name)
+            if extension != ".json" or not _UPLOAD_ID.match(upload_id):
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.root, name)) < deadline:
+                    logger.info(f"Suppression de l'upload expiré {upload_id}")
+                    self.delete(upload_id)
+            except OSError:
+                continue
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+class DirectoryWatcher:
+    """
+    Service d'ingestion d'un répertoire surveillé
+
+    Les fichiers déposés dans WATCH_DIR sont pris en compte une fois stables
+    (taille et date de modification inchangées pendant WATCH_STABLE_SECONDS),
+    analysés en parallèle dans la limite de WATCH_CONCURRENCY, enregistrés
+    comme rapports puis déplacés dans done/ ou failed/. Un checkpoint JSON
+    garde la trace des fichiers traités : après un redémarrage, un fichier
+    déjà traité mais pas encore déplacé n'est pas réanalysé.
+    """
+
+    def __init__(self, process_file: Callable[[str, str], str],
+                 watch_dir: Optional[str] = None,
+                 concurrency: Optional[int] = None,
+                 stable_seconds: Optional[float] = None):
+        """
+        Args:
+            process_file: Fonction (bloquante) analysant un fichier (chemin, nom)
+                          et retournant l'identifiant du rapport enregistré
+            watch_dir: Répertoire surveillé (WATCH_DIR)
+            concurrency: Nombre maximal de fichiers traités en parallèle (WATCH_CONCURRENCY)
+            stable_seconds: Délai de stabilité avant traitement (WATCH_STABLE_SECONDS)
+        """
+        self.process_file = process_file
+        self.watch_dir = os.path.abspath(watch_dir or settings.WATCH_DIR)
+        self.done_dir = os.path.join(self.watch_dir, "done")
+        self.failed_dir = os.path.join(self.watch_dir, "failed")
+        self.checkpoint_path = os.path.join(self.watch_dir, ".aisorter_checkpoint.json")
+        self.stable_seconds = settings.WATCH_STABLE_SECONDS if stable_seconds is None else stable_seconds
+        self._semaphore = asyncio.Semaphore(concurrency or settings.WATCH_CONCURRENCY)
+        self._stop = asyncio.Event()
+        # Fichiers en cours de stabilisation : chemin -> (taille, mtime, stable depuis)
+        self._pending: Dict[str, tuple] = {}
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._checkpoint = self._load_checkpoint()
+        self._metrics = {
+            "started_at": time.time(),
+            "files_processed": 0,
+            "files_failed": 0,
+            "bytes_processed": 0,
+            "total_duration_seconds": 0.0,
+            "total_lag_seconds": 0.0,
+            "last_lag_seconds": None,
+            "max_lag_seconds": 0.0,
+        }
+        # Dates de fin des derniers traitements, pour le débit glissant
+        self._completions = deque()
+        for path in (self.done_dir, self.failed_dir):
+            os.makedirs(path, exist_ok=True)
+
+    # Checkpoint
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Checkpoint illisible, il sera recréé: {e}")
+            return {}
+
+    def _save_checkpoint(self):
+        # Seules les entrées récentes sont gardées : les fichiers sont déplacés après traitement
+        if len(self._checkpoint) > settings.WATCH_CHECKPOINT_MAX_ENTRIES:
+            entries = sorted(self._checkpoint.items(), key=lambda item: item[1].get("finished_at", 0))
+            self._checkpoint = dict(entries[-settings.WATCH_CHECKPOINT_MAX_ENTRIES:])
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @staticmethod
+    def _file_key(name: str, stat: os.stat_result) -> str:
+        return f"{name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    # Détection des fichiers
+
+    def _scan(self):
+        """Relève les fichiers candidats et met à jour leur état de stabilité"""
+        now = time.monotonic()
+        try:
+            entries = list(os.scandir(self.watch_dir))
+        except OSError as e:
+            logger.error(f"Lecture du répertoire surveillé impossible: {e}")
+            return
+        present = set()
+        for entry in entries:
+            if (not entry.is_file() or entry.name.startswith('.')
+                    or not entry.name.lower().endswith(SUPPORTED_EXTENSIONS)):
+                continue
+            path = entry.path
+            present.add(path)
+            if path in self._in_flight:
+                continue
+            stat = entry.stat()
+            done = self._checkpoint.get(self._file_key(entry.name, stat))
+            if done is not None:
+                # Traité avant un arrêt mais pas encore déplacé
+                self._move(path, done["status"])
+                continue
+            observation = (stat.st_size, stat.st_mtime_ns)
+            previous = self._pending.get(path)
+            if previous is None or previous[:2] != observation:
+                self._pending[path] = (*observation, now)
+        for path in list(self._pending):
+            if path not in present:
+                del self._pending[path]
+
+    def _promote_stable_files(self):
+        """Lance le traitement des fichiers stables depuis stable_seconds"""
+        now = time.monotonic()
+        for path, (_, _, since) in list(self._pending.items()):
+            if now - since >= self.stable_seconds:
+                del self._pending[path]
+                self._in_flight[path] = asyncio.create_task(self._process(path))
+
+    async def _stability_loop(self):
+        interval = max(0.2, min(1.0, self.stable_seconds / 2))
+        while not self._stop.is_set():
+            self._scan()
+            self._promote_stable_files()
+            try:
+                await asyncio.wait_for(self._stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # Traitement
+
+    def _move(self, path: str, status: str):
+        target_dir = self.done_dir if status == "done" else self.failed_dir
+        name = os.path.basename(path)
+        target = os.path.join(target_dir, name)
+        if os.path.exists(target):
+            stem, extension = os.path.splitext(name)
+            target = os.path.join(target_dir, f"{stem}.{int(time.time() * 1000)}{extension}")
+        try:
+            shutil.move(path, target)
+        except OSError as e:
+            logger.error(f"Déplacement de {path} impossible: {e}")
+        return target
+
+    async def _process(self, path: str):
+        name = os.path.basename(path)
+        async with self._semaphore:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._in_flight.pop(path, None)
+                return
+            start = time.time()
+            entry = {"status": "done", "started_at": start}
+            try:
+                try:
+                    entry["report_id"] = await asyncio.to_thread(self.process_file, path, name)
+                    logger.info(f"Fichier {name} analysé (rapport {entry['report_id']})")
+                except Exception as e:
+                    entry.update(status="failed", error=str(e))
+                    logger.error(f"Échec de l'analyse de {name}: {e}")
+                entry["finished_at"] = time.time()
+
+                # Checkpoint avant le déplacement : un arrêt entre les deux ne provoque pas de retraitement
+                self._checkpoint[self._file_key(name, stat)] = entry
+                self._save_checkpoint()
+                target = self._move(path, entry["status"])
+                if entry["status"] == "failed":
+                    with open(f"{target}.error.txt", "w", encoding="utf-8") as f:
+                        f.write(entry["error"])
+            except OSError as e:
+                logger.error(f"Finalisation de {name} impossible: {e}")
+            finally:
+                # Toujours libérer le fichier, sinon il n'est plus jamais repris
+                self._record(entry["status"], stat, start, entry.get("finished_at", time.time()))
+                self._in_flight.pop(path, None)
+
+    def _record(self, status: str, stat: os.stat_result, start: float, finished: float):
+        lag = max(0.0, finished - stat.st_mtime)
+        metrics = self._metrics
+        metrics["files_processed" if status == "done" else "files_failed"] += 1
+        metrics["bytes_processed"] += stat.st_size
+        metrics["total_duration_seconds"] += finished - start
+        metrics["total_lag_seconds"] += lag
+        metrics["last_lag_seconds"] = round(lag, 3)
+        metrics["max_lag_seconds"] = round(max(metrics["max_lag_seconds"], lag), 3)
+        self._completions.append(finished)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Débit et retard de traitement du service"""
+        now = time.time()
+        window = settings.WATCH_METRICS_WINDOW_SECONDS
+        while self._completions and self._completions[0] < now - window:
+            self._completions.popleft()
+        metrics = self._metrics
+        completed = metrics["files_processed"] + metrics["files_failed"]
+        oldest_pending = min((since for _, _, since in self._pending.values()), default=None)
+        return {
+            "watch_dir": self.watch_dir,
+            "uptime_seconds": round(now - metrics["started_at"], 1),
+            "files_processed": metrics["files_processed"],
+            "files_failed": metrics["files_failed"],
+            "bytes_processed": metrics["bytes_processed"],
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "throughput_files_per_minute": round(len(self._completions) * 60 / window, 2),
+            "avg_duration_seconds": round(metrics["total_duration_seconds"] / completed, 3) if completed else None,
+            "avg_lag_seconds": round(metrics["total_lag_seconds"] / completed, 3) if completed else None,
+            "last_lag_seconds": metrics["last_lag_seconds"],
+            "max_lag_seconds": metrics["max_lag_seconds"],
+            "oldest_pending_seconds": round(time.monotonic() - oldest_pending, 1) if oldest_pending else None,
+        }
+
+    # Cycle de vie
+
+    async def run(self):
+        """Surveille le répertoire jusqu'à l'appel de stop()"""
+        from watchfiles import awatch
+
+        logger.info(f"Surveillance de {self.watch_dir}")
+        stability = asyncio.create_task(self._stability_loop())
+        try:
+            # Les évènements déclenchent un relevé immédiat, la boucle de stabilité
+            # rattrape les évènements manqués
+            async for _ in awatch(self.watch_dir, recursive=False, stop_event=self._stop):
+                self._scan()
+        finally:
+            self._stop.set()
+            await stability
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+
+    def stop(self):
+        self._stop.set()
+
+def process_file(path: str, filename: str) -> str:
+    """Analyse un fichier en flux et enregistre le rapport (même pipeline que /uploads)"""
+    from ml.model.predictor import predict_from_path
+    from .reports import persist_report
+    report = predict_from_path(path, filename)
+    report['fileName'] = filename
+    return persist_report(report)
+
+async def _run_standalone():
+    watcher = DirectoryWatcher(process_file)
+    task = asyncio.create_task(watcher.run())
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=settings.WATCH_METRICS_WINDOW_SECONDS)
+            logger.info(f"Métriques d'ingestion: {json.dumps(watcher.metrics())}")
+    finally:
+        watcher.stop()
+        await task
+
+def main():
+    if not settings.WATCH_DIR:
+        raise SystemExit("WATCH_DIR n'est pas défini")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_run_standalone())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
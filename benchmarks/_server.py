@@ -0,0 +1,50 @@
+"""
+Lance l'API pour le harnais de charge (benchmarks.loadtest).
+
+Sans --mongo-url, MongoDB est remplacé par mongomock (base en mémoire) ;
+la réputation IP est redirigée vers le serveur factice du harnais via
+ABUSEIPDB_URL, positionnée par le processus parent.
+"""
+import argparse
+import logging
+import sys
+
+# Version de mongomock pour laquelle le correctif de bulk_write ci-dessous a été
+# écrit (benchmarks/requirements.txt) : il touche une méthode interne
+MONGOMOCK_VERSION = "4.3.0"
+
+def main():
+    parser = argparse.ArgumentParser(description="API AISorter pour les tests de charge")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--mongo-url", help="MongoDB réel (mongomock en mémoire par défaut)")
+    args = parser.parse_args()
+
+    if not args.mongo_url:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock est requis sans --mongo-url : pip install -r benchmarks/requirements.txt")
+        if mongomock.__version__ != MONGOMOCK_VERSION:
+            print(f"Attention : mongomock {mongomock.__version__} installé, le harnais est écrit pour "
+                  f"{MONGOMOCK_VERSION} (pip install -r benchmarks/requirements.txt)", file=sys.stderr)
+        import pymongo
+        from mongomock import collection as mongomock_collection
+        # pymongo >= 4.9 transmet `sort` aux upserts de bulk_write (rollups),
+        # argument que mongomock ne connaît pas
+        add_update = getattr(mongomock_collection.BulkOperationBuilder, "add_update", None)
+        if add_update is None:
+            raise SystemExit(f"mongomock {mongomock.__version__} incompatible : "
+                             f"installer mongomock=={MONGOMOCK_VERSION} ou utiliser --mongo-url")
+        mongomock_collection.BulkOperationBuilder.add_update = (
+            lambda self, *a, sort=None, **kw: add_update(self, *a, **kw))
+        # Doit précéder l'import de app.database, qui crée le client à l'import
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import uvicorn
+    from app.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level=logging.WARNING, access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Mesure le temps d'import de app.main et vérifie le budget de démarrage.
+
+Le démarrage ne doit charger aucun module lourd : le pipeline ML (pandas,
+scikit-learn, scipy, openpyxl) est importé au warm-up, dans le lifespan.
+
+Usage :
+    python -m benchmarks.import_time [--budget-ms 1500] [--runs 5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "app.main"
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "openpyxl", "joblib"]
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+def measure_once(module: str) -> float:
+    """Temps d'import (ms) dans un interpréteur neuf, démarrage de Python exclu"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - start) * 1000)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def heavy_modules_loaded(module: str) -> list:
+    """Modules lourds présents dans sys.modules après l'import"""
+    code = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(module: str, top: int = 10) -> list:
+    """Modules les plus coûteux d'après -X importtime (temps cumulé)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append({"module": name.strip(), "cumulative_ms": round(int(cumulative_us) / 1000, 2)})
+    entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return entries[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Budget de temps d'import de l'API")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    timings = [measure_once(MODULE) for _ in range(args.runs)]
+    heavy = heavy_modules_loaded(MODULE)
+    results = {
+        "module": MODULE,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": args.runs,
+        "median_ms": round(statistics.median(timings), 2),
+        "max_ms": round(max(timings), 2),
+        "budget_ms": args.budget_ms,
+        "heavy_modules_loaded": heavy,
+        "slowest_imports": slowest_imports(MODULE),
+    }
+    results["passed"] = results["median_ms"] <= args.budget_ms and not heavy
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if results["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Test de charge hors ligne de l'API : débit, latences et mémoire par scénario.
+
+L'API est lancée dans un sous-processus (benchmarks._server) contre une base
+MongoDB en mémoire (mongomock) et un serveur de réputation IP factice, puis
+chaque scénario rejoue un mélange d'uploads /predict de tailles variées et
+de lectures /history à un débit d'arrivée fixe (boucle ouverte : la latence
+est mesurée depuis l'instant prévu d'envoi, l'attente en file est comptée).
+
+Usage :
+    python -m benchmarks.loadtest --model-path model.pkl [--scenarios scenarios.json]
+                                  [--reputation-latency-ms 20] [--output results.json]
+
+Format d'un scénario (--scenarios, liste JSON) :
+    {"name": "mixte", "rate": 5, "duration": 30,
+     "mix": {"predict:100": 2, "predict:5000": 1, "history": 4, "history_list": 1}}
+
+Les poids de "mix" sont relatifs ; "predict:N" envoie un CSV synthétique de N lignes.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+READY_TIMEOUT_SECONDS = 300
+SEED_REPORTS = 5
+
+DEFAULT_SCENARIOS = [
+    {"name": "history", "rate": 20, "duration": 20, "mix": {"history": 4, "history_list": 1}},
+    {"name": "predict_small", "rate": 2, "duration": 20, "mix": {"predict:200": 1}},
+    {"name": "mixte", "rate": 5, "duration": 30,
+     "mix": {"predict:200": 2, "predict:5000": 1, "history": 4, "history_list": 1}},
+]
+
+# --- Serveur de réputation factice ---
+
+def _reputation_handler(latency_ms: float):
+    class ReputationHandler(BaseHTTPRequestHandler):
+        """Répond comme l'API AbuseIPDB avec un score déterministe par IP"""
+
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            ip = parse_qs(urlparse(self.path).query).get("ipAddress", [""])[0]
+            body = json.dumps({"data": {
+                "ipAddress": ip,
+                "abuseConfidenceScore": sum(map(ord, ip)) % 101,
+                "totalReports": len(ip) % 10,
+                "isWhitelisted": False,
+            }}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReputationHandler
+
+def start_reputation_stub(latency_ms: float) -> ThreadingHTTPServer:
+    """Démarre le serveur de réputation factice sur un port libre (thread démon)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _reputation_handler(latency_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- API sous test ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_api(args, reputation_url: str) -> tuple:
+    """Lance l'API dans un sous-processus et attend /readyz"""
+    port = free_port()
+    env = dict(os.environ,
+               MODEL_PATH=os.path.abspath(args.model_path),
+               ABUSEIPDB_URL=reputation_url,
+               ABUSEIPDB_KEY="loadtest",
+               IP_REPUTATION_MODE="remote_only",
+               WATCH_DIR="")
+    cmd = [sys.executable, "-m", "benchmarks._server", "--port", str(port)]
+    if args.mongo_url:
+        cmd += ["--mongo-url", args.mongo_url]
+        env["MONGO_URL"] = args.mongo_url
+    process = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"L'API s'est arrêtée au démarrage (code {process.returncode})")
+        try:
+            response = requests.get(f"{base_url}/readyz", timeout=2)
+            if response.status_code == 200:
+                return process, base_url
+            if response.json().get("status") == "failed":
+                raise RuntimeError(f"Échec du warm-up : {response.json().get('error')}")
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"API non prête après {READY_TIMEOUT_SECONDS}s")
+
+def stop_api(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+# --- Mémoire (RSS) du processus et de ses workers ---
+
+def _children(pid: int) -> list:
+    # Chaque thread a sa propre liste d'enfants : les workers du pool sont lancés depuis un thread secondaire
+    children = set()
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return []
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children.update(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return list(children)
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def tree_rss_mb(pid: int) -> float:
+    """RSS cumulée (Mo) d'un processus et de ses descendants (pool de workers inclus)"""
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += _rss_kb(current)
+        stack.extend(_children(current))
+    return total / 1024
+
+class RSSSampler:
+    """Échantillonne la RSS de l'arbre de processus et retient le pic"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+# --- Données synthétiques ---
+
+def synthetic_csv(rows: int, seed: int = 0) -> bytes:
+    """Export EDR synthétique au format attendu par le prétraitement"""
+    rng = random.Random(seed)
+    columns = [
+        'childproc_count', 'created_time', 'crossproc_count', 'description', 'feed_name',
+        'filemod_count', 'hostname', 'interface_ip', 'ioc_type', 'ioc_value', 'md5',
+        'modload_count', 'netconn_count', 'os_type', 'process_id', 'process_name',
+        'process_path', 'process_unique_id', 'regmod_count', 'segment_id', 'watchlist_name', 'ioc_attr',
+    ]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    start = time.mktime((2025, 1, 1, 0, 0, 0, 0, 0, -1))
+    for i in range(rows):
+        ioc_attr = {
+            'direction': rng.choice(['outbound', 'inbound']), 'dns_name': f"d{rng.randrange(500)}.example",
+            'local_ip': rng.randrange(2**31), 'local_port': rng.randrange(1024, 65535), 'port': 445,
+            'protocol': rng.choice(['tcp', 'udp']),
+            'remote_ip': f"198.51.{rng.randrange(256)}.{rng.randrange(256)}",
+            'remote_port': rng.choice([22, 80, 443, 3389]),
+        }
+        writer.writerow([
+            rng.randrange(50), time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(start + 60 * i)),
+            rng.randrange(20),
+            rng.choice(['ransomware detected', 'trojan beacon', 'suspicious activity', 'normal']),
+            rng.choice(['SANS', 'AlienVault', 'Other']), rng.randrange(100), f"host{rng.randrange(50)}",
+            rng.randrange(2**31), rng.choice(['md5', 'ipv4', 'domain', 'query']), f"ioc{rng.randrange(1000)}",
+            f"{rng.getrandbits(128):032x}", rng.randrange(40), rng.randrange(40),
+            rng.choice(['windows', 'linux']), rng.randrange(10000),
+            rng.choice(['cmd.exe', 'powershell.exe', 'svchost.exe', 'bash']), "C:\\Windows\\System32",
+            f"p{i}", rng.randrange(30), 1, rng.choice(['Watchlist A', 'Watchlist B']), json.dumps(ioc_attr),
+        ])
+    return buffer.getvalue().encode()
+
+# --- Scénarios ---
+
+class Workload:
+    """Opérations rejouables contre l'API (uploads pré-générés, rapports existants)"""
+
+    def __init__(self, base_url: str, upload_sizes: set, seed_reports: int):
+        self.base_url = base_url
+        # requests.Session n'est pas garanti thread-safe : une session par thread client
+        self._local = threading.local()
+        self.uploads = {rows: synthetic_csv(rows, seed=rows) for rows in sorted(upload_sizes)}
+        self.report_ids = []
+        seed_rows = min(self.uploads) if self.uploads else 200
+        for _ in range(seed_reports):
+            report = self.predict(seed_rows).json()
+            if "_id" in report:
+                self.report_ids.append(report["_id"])
+        if seed_reports and not self.report_ids:
+            raise RuntimeError("Impossible d'enregistrer les rapports initiaux pour /history")
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def predict(self, rows: int) -> requests.Response:
+        if rows not in self.uploads:
+            self.uploads[rows] = synthetic_csv(rows, seed=rows)
+        content = self.uploads[rows]
+        files = {"file": (f"loadtest_{rows}.csv", content, "text/csv")}
+        return self.session.post(f"{self.base_url}/predict", files=files, timeout=600)
+
+    def history(self) -> requests.Response:
+        report_id = random.choice(self.report_ids)
+        return self.session.get(f"{self.base_url}/history/{report_id}", params={"limit": 50},
+                                headers={"Accept-Encoding": "gzip"}, timeout=600)
+
+    def history_list(self) -> requests.Response:
+        return self.session.get(f"{self.base_url}/history", timeout=600)
+
+    def call(self, operation: str) -> requests.Response:
+        if operation.startswith("predict:"):
+            return self.predict(int(operation.split(":", 1)[1]))
+        if operation == "history":
+            return self.history()
+        if operation == "history_list":
+            return self.history_list()
+        raise ValueError(f"Opération inconnue : {operation}")
+
+def percentile(values: list, pct: float) -> float:
+    """Percentile par interpolation linéaire (values triées)"""
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+def latency_stats(samples: list) -> dict:
+    latencies = sorted(sample["latency_ms"] for sample in samples)
+    errors = sum(1 for sample in samples if not sample["ok"])
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+def run_scenario(workload: Workload, scenario: dict, pid: int, max_in_flight: int) -> dict:
+    """Rejoue un scénario à débit d'arrivée fixe et agrège les mesures"""
+    rng = random.Random(scenario["name"])
+    operations, weights = zip(*scenario["mix"].items())
+    total = int(scenario["rate"] * scenario["duration"])
+    interval = 1 / scenario["rate"]
+    samples = []
+    lock = threading.Lock()
+
+    def send(operation: str, scheduled: float):
+        error = None
+        try:
+            response = workload.call(operation)
+            ok = response.status_code < 400
+            if not ok:
+                error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            ok, error = False, type(e).__name__
+        sample = {"operation": operation, "ok": ok, "error": error,
+                  "latency_ms": (time.perf_counter() - scheduled) * 1000}
+        with lock:
+            samples.append(sample)
+
+    with RSSSampler(pid) as rss, ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, rng.choices(operations, weights)[0], scheduled)
+        pool.shutdown(wait=True)
+        elapsed = time.perf_counter() - start
+
+    errors = {}
+    for sample in samples:
+        if sample["error"]:
+            errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+    return {
+        "name": scenario["name"],
+        "target_rate": scenario["rate"],
+        "duration_seconds": scenario["duration"],
+        "mix": scenario["mix"],
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(sum(s["ok"] for s in samples) / elapsed, 2) if elapsed else 0.0,
+        **latency_stats(samples),
+        "error_types": errors,
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "operations": {op: latency_stats([s for s in samples if s["operation"] == op])
+                       for op in operations},
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge hors ligne de l'API")
+    parser.add_argument("--model-path", default=os.getenv("MODEL_PATH"), required=not os.getenv("MODEL_PATH"))
+    parser.add_argument("--scenarios", help="Fichier JSON de scénarios (défaut : scénarios intégrés)")
+    parser.add_argument("--reputation-latency-ms", type=float, default=20,
+                        help="Latence simulée du serveur de réputation")
+    parser.add_argument("--max-in-flight", type=int, default=64,
+                        help="Requêtes simultanées maximum côté client")
+    parser.add_argument("--mongo-url", help="MongoDB réel au lieu de mongomock")
+    parser.add_argument("--output", help="Fichier JSON de résultats (défaut : benchmarks/results/)")
+    args = parser.parse_args()
+
+    scenarios = DEFAULT_SCENARIOS
+    if args.scenarios:
+        with open(args.scenarios, encoding="utf-8") as f:
+            scenarios = json.load(f)
+    upload_sizes = {int(op.split(":", 1)[1]) for scenario in scenarios
+                    for op in scenario["mix"] if op.startswith("predict:")}
+
+    reputation = start_reputation_stub(args.reputation_latency_ms)
+    reputation_url = f"http://127.0.0.1:{reputation.server_address[1]}/api/v2/check"
+    process, base_url = start_api(args, reputation_url)
+    try:
+        workload = Workload(base_url, upload_sizes, SEED_REPORTS)
+        results = []
+        for scenario in scenarios:
+            print(f"Scénario {scenario['name']} : {scenario['rate']} req/s pendant {scenario['duration']}s",
+                  file=sys.stderr)
+            result = run_scenario(workload, scenario, process.pid, args.max_in_flight)
+            print(f"  {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                  f"p99 {result['p99_ms']} ms, erreurs {result['error_rate']:.1%}, "
+                  f"RSS max {result['peak_rss_mb']} Mo", file=sys.stderr)
+            results.append(result)
+    finally:
+        stop_api(process)
+        reputation.shutdown()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "args": {"reputation_latency_ms": args.reputation_latency_ms,
+                 "max_in_flight": args.max_in_flight, "mongo": "real" if args.mongo_url else "mongomock"},
+        "scenarios": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Résultats enregistrés dans {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,51 @@
 import os
+import tempfile
 
 class Settings:
     # Relatif à la racine du projet : le modèle sera sauvegardé dans le dossier ml/model
     MODEL_PATH = str(os.getenv('MODEL_PATH'))
     API_KEY = str(os.getenv('API_KEY'))
     ABUSEIPDB_KEY = str(os.getenv('ABUSEIPDB_KEY'))
+    ABUSEIPDB_URL = os.getenv('ABUSEIPDB_URL', 'https://api.abuseipdb.com/api/v2/check')
     MONGO_URL = str(os.getenv('MONGO_URL'))
     DB_NAME = str(os.getenv('DB_NAME'))
     COLLECTION_NAME = str(os.getenv('COLLECTION_NAME'))
     TRAINING_DATA_PATH = str(os.getenv('TRAINING_DATA_PATH'))
+    ROLLUP_COLLECTION_NAME = os.getenv('ROLLUP_COLLECTION_NAME', 'report_rollups')
+    # Réputation IP : index local (feeds de blocklists) et/ou API AbuseIPDB
+    # local_first : index local puis API pour les IP absentes, local_only, remote_only
+    IP_REPUTATION_MODE = os.getenv('IP_REPUTATION_MODE', 'local_first')
+    IP_REPUTATION_FEEDS_DIR = os.getenv('IP_REPUTATION_FEEDS_DIR', '')
+    IP_REPUTATION_DEFAULT_SCORE = float(os.getenv('IP_REPUTATION_DEFAULT_SCORE', '10'))
+    IP_REPUTATION_REFRESH_SECONDS = int(os.getenv('IP_REPUTATION_REFRESH_SECONDS', '60'))
+    # Regroupement des incidents identiques dans les rapports
+    INCIDENT_GROUPING = os.getenv('INCIDENT_GROUPING', 'true').lower() in ('1', 'true', 'yes')
+    INCIDENT_GROUP_KEYS = [key.strip() for key in os.getenv('INCIDENT_GROUP_KEYS', 'hostname,ioc_value,process_name').split(',') if key.strip()]
+    # Prédiction parallèle par blocs de lignes
+    PREDICT_CHUNK_SIZE = int(os.getenv('PREDICT_CHUNK_SIZE', '5000'))
+    PREDICT_WORKERS = int(os.getenv('PREDICT_WORKERS', str(os.cpu_count() or 1)))
+    PREDICT_PARALLEL_MIN_ROWS = int(os.getenv('PREDICT_PARALLEL_MIN_ROWS', '20000'))
+    # Limites des lots et archives (/predict/batch), vérifiées avant décompression
+    BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '1000'))
+    BATCH_MAX_FILE_BYTES = int(os.getenv('BATCH_MAX_FILE_BYTES', str(512 * 1024**2)))
+    BATCH_MAX_TOTAL_BYTES = int(os.getenv('BATCH_MAX_TOTAL_BYTES', str(2 * 1024**3)))
+    # Ingestion temps réel par micro-batches (WebSocket)
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '500'))
+    INGEST_MAX_WAIT_MS = int(os.getenv('INGEST_MAX_WAIT_MS', '500'))
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '5000'))
+    # Uploads reprenables : spool disque et lecture en flux par blocs de lignes
+    UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'aisorter_uploads'))
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(8 * 1024**3)))
+    UPLOAD_TTL_HOURS = int(os.getenv('UPLOAD_TTL_HOURS', '24'))
+    READ_CHUNK_SIZE = int(os.getenv('READ_CHUNK_SIZE', '50000'))
+    # Ingestion d'un répertoire surveillé (désactivée si WATCH_DIR est vide)
+    WATCH_DIR = os.getenv('WATCH_DIR', '')
+    WATCH_CONCURRENCY = int(os.getenv('WATCH_CONCURRENCY', '2'))
+    WATCH_STABLE_SECONDS = float(os.getenv('WATCH_STABLE_SECONDS', '5'))
+    WATCH_CHECKPOINT_MAX_ENTRIES = int(os.getenv('WATCH_CHECKPOINT_MAX_ENTRIES', '10000'))
+    WATCH_METRICS_WINDOW_SECONDS = int(os.getenv('WATCH_METRICS_WINDOW_SECONDS', '300'))
+    # Compression des réponses
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+    RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '6'))
+    RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '5'))
 settings = Settings()
@@ -1,8 +1,39 @@
-import joblib
 import os
+import threading
+import time
 from core.config import settings
 
+# Modèle partagé par le processus, chargé une seule fois (voir get_model)
+_model = None
+_model_lock = threading.Lock()
+
+# État exposé par /readyz : cold -> loading -> warming -> ready (ou failed)
+model_state = {
+    "status": "cold",
+    "error": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+}
+
 def load_model():
+    # Import différé : joblib n'est chargé qu'au premier chargement du modèle
+    import joblib
     if not os.path.exists(settings.MODEL_PATH):
         raise FileNotFoundError(f"Model file not found at {settings.MODEL_PATH}")
     return joblib.load(settings.MODEL_PATH)
+
+def get_model():
+    """Retourne le modèle du processus, chargé au premier appel"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model_state["status"] = "loading"
+                start = time.perf_counter()
+                try:
+                    _model = load_model()
+                except Exception as e:
+                    model_state.update(status="failed", error=str(e))
+                    raise
+                model_state["load_seconds"] = round(time.perf_counter() - start, 3)
+    return _model
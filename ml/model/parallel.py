@@ -0,0 +1,146 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from core.config import settings
+from .loader import load_model
+
+logger = logging.getLogger(__name__)
+
+# Modèle chargé une seule fois par processus worker (jamais picklé par tâche)
+_worker_model = None
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Le pool est créé depuis un processus déjà multi-threadé (uvicorn, warm-up) :
+# un fork pourrait hériter d'un verrou tenu (logging, pymongo) et bloquer le
+# worker. L'initialiseur recharge le modèle, rien ne dépend de la mémoire héritée.
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _init_worker():
+    """Initialise un worker : charge le modèle depuis le disque une seule fois"""
+    global _worker_model
+    _worker_model = load_model()
+
+
+def _predict_block(block: pd.DataFrame) -> np.ndarray:
+    """Applique le pipeline complet du modèle sur un bloc de lignes"""
+    return _worker_model.predict(block)
+
+
+def get_pool(n_workers: int) -> ProcessPoolExecutor:
+    """
+    Retourne le pool de workers partagé, créé à la demande avec n_workers.
+    Sa taille est fixée à la création : il n'est jamais arrêté pour être
+    redimensionné, ce qui annulerait les blocs en cours des autres requêtes.
+    Un pool cassé (worker tué, initialiseur en échec) est remplacé.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and getattr(_pool, "_broken", False):
+            logger.warning("Pool de prédiction cassé, redémarrage")
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            logger.info(f"Démarrage du pool de prédiction ({n_workers} workers)")
+            _pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context(_START_METHOD))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Abandonne un pool cassé pour que le prochain get_pool en recrée un"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _map(fn, items: list, n_workers: int) -> list:
+    """map ordonné sur le pool partagé, relancé une fois sur un pool neuf si un worker meurt"""
+    pool = get_pool(n_workers)
+    try:
+        return list(pool.map(fn, items))
+    except BrokenProcessPool:
+        logger.warning("Un worker de prédiction s'est arrêté, nouvel essai sur un pool neuf")
+        _discard_pool(pool)
+        return _map(fn, items, n_workers)
+
+
+def _ping(_) -> bool:
+    return _worker_model is not None
+
+
+def warm_pool(n_workers: Optional[int] = None):
+    """Démarre le pool et force chaque worker à charger le modèle"""
+    n_workers = n_workers or settings.PREDICT_WORKERS
+    if n_workers <= 1:
+        return
+    _map(_ping, range(n_workers), n_workers)
+
+
+def shutdown_pool():
+    """Arrête le pool de workers s'il a été démarré"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def predict_parallel(model, df: pd.DataFrame,
+                     chunk_size: Optional[int] = None,
+                     n_workers: Optional[int] = None,
+                     min_rows: Optional[int] = None) -> np.ndarray:
+    """
+    Prédit sur un DataFrame prétraité en le découpant en blocs de lignes
+    traités en parallèle sur plusieurs coeurs.
+
+    Args:
+        model: Pipeline complet chargé (utilisé pour le repli en un seul appel)
+        df: DataFrame prétraité par DataPreprocessor
+        chunk_size: Nombre de lignes par bloc (PREDICT_CHUNK_SIZE par défaut)
+        n_workers: Nombre de processus workers (PREDICT_WORKERS par défaut)
+        min_rows: Taille minimale pour activer le parallélisme
+                  (PREDICT_PARALLEL_MIN_ROWS par défaut)
+
+    Returns:
+        Array des prédictions, dans l'ordre des lignes de df
+    """
+    chunk_size = max(1, chunk_size or settings.PREDICT_CHUNK_SIZE)
+    n_workers = n_workers or settings.PREDICT_WORKERS
+    min_rows = settings.PREDICT_PARALLEL_MIN_ROWS if min_rows is None else min_rows
+
+    n_rows = len(df)
+    n_blocks = -(-n_rows // chunk_size)
+
+    # Repli en un seul appel pour les petites entrées
+    if n_workers <= 1 or n_rows < min_rows or n_blocks <= 1:
+        return model.predict(df)
+
+    blocks = [df.iloc[start:start + chunk_size] for start in range(0, n_rows, chunk_size)]
+    logger.info(f"Prédiction parallèle: {n_rows} lignes, {len(blocks)} blocs, {n_workers} workers")
+
+    # map conserve l'ordre des blocs
+    preds = _map(_predict_block, blocks, n_workers)
+    return np.concatenate(preds)
+
+
+def run_parallel(fn, items: list, n_workers: Optional[int] = None) -> list:
+    """
+    Applique fn à chaque élément dans le pool partagé, en conservant l'ordre.
+    Exécution séquentielle si un seul élément ou un seul worker.
+    fn doit être une fonction de module (picklable).
+    """
+    n_workers = n_workers or settings.PREDICT_WORKERS
+    if n_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    return _map(fn, items, n_workers)
@@ -1,50 +1,307 @@
 import pandas as pd
+import numpy as np
 import io
+import tarfile
+import zipfile
 import joblib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from fastapi import UploadFile
-from .loader import load_model
+import logging
+import time
+from .loader import get_model, model_state
+from .parallel import predict_parallel, run_parallel, warm_pool
 from ..preprocessing.cleaning import DataPreprocessor
-from ..postprocessing.processor import generate_incident_report_json
+from ..postprocessing.processor import IncidentProcessor, generate_incident_report_json
+from ..postprocessing.reporting import iter_incidents, prepare_report_frame
+from ..postprocessing.scoring import RunningScoreBounds
 from core.config import settings
 
-# Load model once
-try:
-    model = load_model()
-except Exception as e:
-    print(f"Warning: Could not load model: {e}")
-    model = None
+logger = logging.getLogger(__name__)
 
-def predict_from_file(upload_file: UploadFile):
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+def read_dataframe(filename: str, content: bytes) -> pd.DataFrame:
+    """Lit le contenu d'un fichier CSV ou Excel dans un DataFrame"""
+    filename = filename.lower()
+    if filename.endswith('.csv'):
+        return pd.read_csv(io.BytesIO(content))
+    elif filename.endswith('.xlsx') or filename.endswith('.xls'):
+        return pd.read_excel(io.BytesIO(content))
+    raise ValueError('Format de fichier non supporté (CSV, XLSX)')
+
+class ArchiveTooLarge(ValueError):
+    """Lot ou archive dépassant les limites BATCH_MAX_* (protection contre les bombes de décompression)"""
+
+def check_batch_limits(sizes: List[Tuple[str, int]]):
     """
-    Prend un UploadFile (Excel ou CSV), lit le fichier, applique le prétraitement DataPreprocessor,
-    vérifie et réordonne les colonnes, applique le modèle, retourne les prédictions.
+    Vérifie le nombre de fichiers et leurs tailles décompressées.
+    Appelée sur les tailles annoncées par l'archive, avant toute décompression.
+    """
+    if len(sizes) > settings.BATCH_MAX_FILES:
+        raise ArchiveTooLarge(f"Lot limité à {settings.BATCH_MAX_FILES} fichiers ({len(sizes)} reçus)")
+    for name, size in sizes:
+        if size > settings.BATCH_MAX_FILE_BYTES:
+            raise ArchiveTooLarge(f"{name} : {size} octets décompressés (limite {settings.BATCH_MAX_FILE_BYTES})")
+    total = sum(size for _, size in sizes)
+    if total > settings.BATCH_MAX_TOTAL_BYTES:
+        raise ArchiveTooLarge(f"Lot de {total} octets décompressés (limite {settings.BATCH_MAX_TOTAL_BYTES})")
+
+def expand_archive(filename: str, content: bytes) -> List[Tuple[str, bytes]]:
     """
-    model = load_model()
+    Retourne la liste (nom, contenu) des fichiers CSV/XLSX d'un upload.
+    Les archives zip/tar sont dépliées en mémoire, les autres fichiers sont retournés tels quels.
+    Lève ArchiveTooLarge si l'archive dépasse les limites BATCH_MAX_*.
+    """
+    lower = filename.lower()
+    if lower.endswith('.zip'):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            # La lecture d'un membre s'arrête à file_size : la taille annoncée borne la décompression
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and _is_supported_member(info.filename)]
+            check_batch_limits([(info.filename, info.file_size) for info in members])
+            return [(f"{filename}/{info.filename}", archive.read(info)) for info in members]
+    elif lower.endswith(('.tar', '.tar.gz', '.tgz')):
+        with tarfile.open(fileobj=io.BytesIO(content), mode='r:*') as archive:
+            members = [member for member in archive.getmembers()
+                       if member.isfile() and _is_supported_member(member.name)]
+            check_batch_limits([(member.name, member.size) for member in members])
+            return [(f"{filename}/{member.name}", archive.extractfile(member).read())
+                    for member in members]
+    check_batch_limits([(filename, len(content))])
+    return [(filename, content)]
+
+def _is_supported_member(name: str) -> bool:
+    """Ignore les fichiers cachés et les formats non supportés d'une archive"""
+    basename = name.rsplit('/', 1)[-1]
+    return (not basename.startswith('.') and '__MACOSX' not in name
+            and basename.lower().endswith(SUPPORTED_EXTENSIONS))
+
+def load_and_preprocess(item: Tuple[str, bytes]) -> Tuple[str, pd.DataFrame]:
+    """Lit et prétraite un fichier (exécuté dans un worker pour les lots)"""
+    name, content = item
+    df = read_dataframe(name, content)
+    return name, DataPreprocessor().fit_transform(df)
+
+def warm_up():
+    """
+    Charge le modèle et exécute une prédiction synthétique pour initialiser
+    tout le pipeline (prétraitement, encodeurs, pool de workers) avant le
+    premier appel. Appelée au démarrage de l'API, met à jour model_state.
+    """
+    model = get_model()
+    model_state["status"] = "warming"
+    start = time.perf_counter()
+    try:
+        preprocessor = DataPreprocessor()
+        row = {col: 0 for col in preprocessor.expected_columns}
+        row.update({col: 'warmup' for col in (
+            'description', 'feed_name', 'hostname', 'interface_ip', 'ioc_type', 'ioc_value',
+            'md5', 'os_type', 'process_name', 'process_path', 'process_unique_id',
+            'watchlist_name', 'ioc_attr_direction', 'ioc_attr_dns_name', 'ioc_attr_protocol'
+        )})
+        row['created_time'] = pd.Timestamp.now().isoformat()
+        df_processed = preprocessor.fit_transform(pd.DataFrame([row]))
+        model.predict(df_processed)
+        warm_pool()
+    except Exception as e:
+        model_state.update(status="failed", error=str(e))
+        raise
+    model_state["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    model_state["status"] = "ready"
+    logger.info(f"Modèle prêt (chargement {model_state['load_seconds']}s, warm-up {model_state['warmup_seconds']}s)")
+
+def iter_dataframe_chunks(path: str, filename: str,
+                          chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lecture en flux d'un fichier sur disque par blocs de lignes, sans le
+    charger entièrement en mémoire (CSV avec pandas, XLSX avec openpyxl en
+    lecture seule ; les anciens .xls sont lus en une fois)
+    """
+    chunk_size = chunk_size or settings.READ_CHUNK_SIZE
+    lower = filename.lower()
+    if lower.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    elif lower.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            columns = next(rows, None)
+            if columns is None:
+                return
+            block = []
+            for row in rows:
+                block.append(row)
+                if len(block) >= chunk_size:
+                    yield pd.DataFrame(block, columns=columns)
+                    block = []
+            if block:
+                yield pd.DataFrame(block, columns=columns)
+        finally:
+            workbook.close()
+    elif lower.endswith('.xls'):
+        yield pd.read_excel(path)
+    else:
+        raise ValueError('Format de fichier non supporté (CSV, XLSX)')
+
+def predict_from_path(path: str, filename: str, group: Optional[bool] = None):
+    """
+    Analyse un fichier déjà sur disque (upload reprenable, répertoire surveillé)
+    en flux : chaque bloc de lignes est prétraité et prédit, seules les lignes
+    prédites comme incidents sont conservées. Le scoring est ensuite calculé
+    sur l'ensemble des incidents, la normalisation reste globale.
+    """
+    model = get_model()
+
+    incidents = []
+    rows_processed = 0
+    for chunk in iter_dataframe_chunks(path, filename):
+        # Un préprocesseur par bloc : transform modifie son état (expected_columns)
+        df_processed = DataPreprocessor().fit_transform(chunk)
+        preds = predict_parallel(model, df_processed)
+        incidents.append(df_processed[preds == True])
+        rows_processed += len(chunk)
+    if not incidents:
+        raise ValueError('Fichier vide')
+
+    df_incidents = pd.concat(incidents, ignore_index=True)
+    report = generate_incident_report_json(
+        X=df_incidents,
+        y_pred=np.ones(len(df_incidents), dtype=bool),
+        api_key=settings.API_KEY,
+        group=group
+    )
+    report.setdefault("metadata", {})["rows_processed"] = rows_processed
+    logger.info(f"{rows_processed} lignes analysées en flux depuis {filename}")
+    return report
+
+def _predict_upload(upload_file: UploadFile) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Lit, prétraite et prédit un fichier uploadé"""
+    model = get_model()
 
     if model is None:
         raise RuntimeError("Model is not loaded")
 
-    filename = upload_file.filename.lower()
     content = upload_file.file.read()
-    
-    if filename.endswith('.csv'):
-        df = pd.read_csv(io.BytesIO(content))
-    elif filename.endswith('.xlsx') or filename.endswith('.xls'):
-        df = pd.read_excel(io.BytesIO(content))
-    else:
-        raise ValueError('Format de fichier non supporté (CSV, XLSX)')
+    df = read_dataframe(upload_file.filename, content)
         
     # Prétraitement prudent
     preprocessor_safe = DataPreprocessor()
     df_processed = preprocessor_safe.fit_transform(df)
     
-    # Prédiction directe avec le pipeline complet
-    preds = model.predict(df_processed)
+    # Prédiction avec le pipeline complet, par blocs en parallèle sur les gros fichiers
+    preds = predict_parallel(model, df_processed)
+    return df_processed, preds
+
+def predict_from_file(upload_file: UploadFile, group: Optional[bool] = None):
+    """
+    Prend un UploadFile (Excel ou CSV), lit le fichier, applique le prétraitement DataPreprocessor,
+    vérifie et réordonne les colonnes, applique le modèle, retourne les prédictions.
+    group=False conserve un incident par ligne au lieu des incidents regroupés.
+    """
+    df_processed, preds = _predict_upload(upload_file)
     
     report = generate_incident_report_json(
         X=df_processed, 
         y_pred=preds, 
-        api_key=settings.API_KEY
+        api_key=settings.API_KEY,
+        group=group
     )
     
     return report
+
+def predict_top_k_from_file(upload_file: UploadFile, top_k: int,
+                            group: Optional[bool] = None) -> Tuple[Dict[str, Any], Callable[[], Dict[str, Any]]]:
+    """
+    Variante de predict_from_file ne construisant que les K incidents les plus critiques.
+    Summary et analytics restent exacts. Retourne aussi une fonction construisant
+    le rapport complet trié, à persister hors du chemin critique de la requête.
+    """
+    df_processed, preds = _predict_upload(upload_file)
+    processor = IncidentProcessor(settings.API_KEY, group=group)
+    df_scored = processor.score_incidents(df_processed, preds, sort=False)
+    report = processor.build_report(df_scored, df_processed, top_k=top_k)
+
+    def build_full_report() -> Dict[str, Any]:
+        df_sorted = df_scored if df_scored.empty else processor.sort_incidents(df_scored)
+        return processor.build_report(df_sorted, df_processed)
+
+    return report, build_full_report
+
+def stream_from_file(upload_file: UploadFile, group: Optional[bool] = None) -> Tuple[Dict[str, Any], Iterator[Dict[str, Any]], Callable[[], Dict[str, Any]]]:
+    """
+    Variante de predict_from_file pour la réponse en flux : retourne l'en-tête du
+    rapport (summary, analytics), un itérateur paresseux des incidents triés et
+    une fonction construisant le rapport complet, à persister indépendamment du flux.
+    """
+    df_processed, preds = _predict_upload(upload_file)
+    processor = IncidentProcessor(settings.API_KEY, group=group)
+    header, incidents = processor.stream_incident_report(df_processed, preds)
+
+    def build_full_report() -> Dict[str, Any]:
+        return {**header, "incidents": list(incidents())}
+
+    return header, incidents(), build_full_report
+
+def predict_from_files(upload_files: List[UploadFile], group: Optional[bool] = None):
+    """
+    Analyse un lot de fichiers (CSV, XLSX ou archives zip/tar) en un seul rapport.
+    Les fichiers sont lus et prétraités en parallèle, prédits en un seul appel
+    batché et scorés ensemble pour que la normalisation soit globale.
+    Chaque incident conserve son fichier source (colonne source_file).
+    """
+    model = get_model()
+
+    if model is None:
+        raise RuntimeError("Model is not loaded")
+
+    items = []
+    for upload_file in upload_files:
+        items.extend(expand_archive(upload_file.filename, upload_file.file.read()))
+        # Limites appliquées au lot entier, pas seulement à chaque archive
+        check_batch_limits([(name, len(content)) for name, content in items])
+    if not items:
+        raise ValueError('Aucun fichier CSV/XLSX trouvé dans le lot')
+
+    processed = run_parallel(load_and_preprocess, items)
+
+    # Concaténation avec un index unique, le fichier source est gardé à part
+    df_processed = pd.concat([df for _, df in processed], ignore_index=True)
+    source_files = pd.concat(
+        [pd.Series(name, index=range(len(df))) for name, df in processed],
+        ignore_index=True
+    )
+
+    # Un seul appel batché (parallélisé par blocs si le lot est volumineux)
+    preds = predict_parallel(model, df_processed)
+
+    df_processed['source_file'] = source_files.values
+    report = generate_incident_report_json(
+        X=df_processed,
+        y_pred=preds,
+        api_key=settings.API_KEY,
+        group=group
+    )
+
+    return report
+
+def predict_records(records: List[Dict[str, Any]],
+                    score_bounds: Optional[RunningScoreBounds] = None) -> List[Dict[str, Any]]:
+    """
+    Analyse un micro-batch d'alertes (une alerte = un dict de colonnes brutes,
+    comme une ligne de CSV) et retourne les incidents scorés, triés par criticité.
+    Les scores sont normalisés sur score_bounds, partagé par tous les micro-batches
+    d'un même flux, pour rester comparables d'un batch à l'autre.
+    """
+    model = get_model()
+
+    df = pd.DataFrame.from_records(records)
+    df_processed = DataPreprocessor().fit_transform(df)
+    preds = predict_parallel(model, df_processed)
+
+    processor = IncidentProcessor(settings.API_KEY, score_bounds=score_bounds or RunningScoreBounds())
+    df_sorted = processor.score_incidents(df_processed, preds)
+    if df_sorted.empty:
+        return []
+    return list(iter_incidents(prepare_report_frame(df_sorted)))
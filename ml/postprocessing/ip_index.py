@@ -0,0 +1,242 @@
+import csv
+import heapq
+import ipaddress
+import logging
+import os
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+IP_COLUMNS = ('ip', 'ip_address', 'ipaddress', 'cidr', 'network', 'range', 'address')
+SCORE_COLUMNS = ('score', 'abuseconfidencescore', 'confidence', 'risk', 'reputation')
+
+def normalize_score(value: Optional[str], default: float) -> float:
+    """Ramène un score de feed sur l'échelle 0-10 (les scores > 10 sont lus sur 0-100)"""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return default
+    if score > 10:
+        score = score / 10
+    return float(min(max(score, 0), 10))
+
+def parse_network(token: str) -> Optional[Tuple[int, int]]:
+    """Convertit une IP ou un CIDR IPv4 en intervalle (début, fin) d'entiers, None sinon"""
+    try:
+        network = ipaddress.ip_network(token.strip(), strict=False)
+    except ValueError:
+        return None
+    if network.version != 4:
+        return None
+    return int(network.network_address), int(network.broadcast_address)
+
+def _parse_csv(path: str, default: float) -> Iterator[Tuple[int, int, float]]:
+    with open(path, newline='', encoding='utf-8', errors='ignore') as f:
+        rows = csv.reader(f)
+        ip_col, score_col = 0, 1
+        for line_number, row in enumerate(rows):
+            if not row or row[0].lstrip().startswith('#'):
+                continue
+            if line_number == 0 and parse_network(row[0]) is None:
+                # En-tête : repérage des colonnes IP et score
+                header = [col.strip().lower() for col in row]
+                ip_col = next((i for i, col in enumerate(header) if col in IP_COLUMNS), 0)
+                score_col = next((i for i, col in enumerate(header) if col in SCORE_COLUMNS), None)
+                continue
+            if ip_col >= len(row):
+                continue
+            interval = parse_network(row[ip_col])
+            if interval is not None:
+                score = row[score_col] if score_col is not None and score_col < len(row) else None
+                yield interval[0], interval[1], normalize_score(score, default)
+
+def _parse_text(path: str, default: float) -> Iterator[Tuple[int, int, float]]:
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.split('#', 1)[0].split(';', 1)[0].strip()
+            if not line:
+                continue
+            tokens = line.replace(',', ' ').split()
+            interval = parse_network(tokens[0])
+            if interval is not None:
+                score = tokens[1] if len(tokens) > 1 else None
+                yield interval[0], interval[1], normalize_score(score, default)
+
+def parse_feed_file(path: str, default: float) -> Iterator[Tuple[int, int, float]]:
+    """Lit un fichier de blocklist (CSV ou texte : une IP/CIDR par ligne, score optionnel)"""
+    if path.lower().endswith('.csv'):
+        return _parse_csv(path, default)
+    return _parse_text(path, default)
+
+class IPReputationIndex:
+    """
+    Index local de réputation IP : intervalles IPv4 disjoints et triés, stockés
+    dans des tableaux uint32 (début, fin) avec leur score (0-10). Une colonne
+    entière d'IP est résolue par recherche dichotomique vectorisée.
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, scores: np.ndarray):
+        self.starts = starts.astype(np.uint32)
+        self.ends = ends.astype(np.uint32)
+        self.scores = scores.astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_ranges(cls, starts: np.ndarray, ends: np.ndarray, scores: np.ndarray) -> 'IPReputationIndex':
+        """
+        Construit l'index à partir d'intervalles quelconques (doublons et
+        chevauchements autorisés) : le score retenu est le maximum des
+        intervalles couvrant une adresse
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(starts) == 0:
+            return cls(starts, ends, scores)
+
+        # Doublons exacts : score maximal
+        ranges = pd.DataFrame({'start': starts, 'end': ends, 'score': scores})
+        ranges = ranges.groupby(['start', 'end'], sort=True)['score'].max().reset_index()
+        starts, ends, scores = (ranges[col].to_numpy() for col in ('start', 'end', 'score'))
+
+        # Cas courant (IP isolées) : intervalles déjà disjoints
+        if np.all(starts[1:] > ends[:-1]):
+            return cls(starts, ends, scores)
+        return cls(*cls._flatten(starts, ends, scores))
+
+    @staticmethod
+    def _flatten(starts: np.ndarray, ends: np.ndarray,
+                 scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Découpe des intervalles chevauchants en segments disjoints (balayage avec tas)"""
+        bounds = np.unique(np.concatenate([starts, ends + 1]))
+        heap: List[Tuple[float, int]] = []
+        out_starts, out_ends, out_scores = [], [], []
+        j, n = 0, len(starts)
+        for k in range(len(bounds) - 1):
+            point = bounds[k]
+            while j < n and starts[j] <= point:
+                heapq.heappush(heap, (-scores[j], ends[j]))
+                j += 1
+            while heap and heap[0][1] < point:
+                heapq.heappop(heap)
+            if not heap:
+                continue
+            score = -heap[0][0]
+            segment_end = bounds[k + 1] - 1
+            # Fusion avec le segment précédent s'il est contigu et de même score
+            if out_ends and out_ends[-1] + 1 == point and out_scores[-1] == score:
+                out_ends[-1] = segment_end
+            else:
+                out_starts.append(point)
+                out_ends.append(segment_end)
+                out_scores.append(score)
+        return np.array(out_starts), np.array(out_ends), np.array(out_scores)
+
+    def lookup(self, ips: pd.Series) -> np.ndarray:
+        """
+        Score de chaque IP de la série (NaN si absente de l'index ou invalide)
+
+        Les IP distinctes sont converties en uint32 puis résolues en une seule
+        recherche dichotomique (np.searchsorted)
+        """
+        result = np.full(len(ips), np.nan)
+        if len(self) == 0 or len(ips) == 0:
+            return result
+
+        codes, uniques = pd.factorize(ips.astype(str).str.strip())
+        octets = pd.Series(uniques).str.extract(r'^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$')
+        octets = octets.apply(pd.to_numeric, errors='coerce')
+        valid = (octets.notna() & (octets <= 255)).all(axis=1).to_numpy()
+        values = octets.fillna(0).to_numpy(dtype=np.int64)
+        addresses = (values[:, 0] << 24) | (values[:, 1] << 16) | (values[:, 2] << 8) | values[:, 3]
+
+        position = np.searchsorted(self.starts, addresses, side='right') - 1
+        clipped = np.clip(position, 0, len(self) - 1)
+        found = valid & (position >= 0) & (addresses <= self.ends[clipped])
+        unique_scores = np.where(found, self.scores[clipped], np.nan)
+
+        mask = codes >= 0
+        result[mask] = unique_scores[codes[mask]]
+        return result
+
+def feed_files(feeds_dir: str) -> List[str]:
+    """Fichiers de feeds d'un répertoire (fichiers cachés ignorés)"""
+    if not feeds_dir or not os.path.isdir(feeds_dir):
+        return []
+    return sorted(
+        os.path.join(feeds_dir, name) for name in os.listdir(feeds_dir)
+        if not name.startswith('.') and os.path.isfile(os.path.join(feeds_dir, name))
+    )
+
+def feeds_signature(paths: List[str]) -> Tuple:
+    """Signature (nom, taille, date de modification) des feeds pour détecter les changements"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+def build_index(paths: List[str], default_score: Optional[float] = None) -> IPReputationIndex:
+    """Construit l'index à partir des fichiers de feeds"""
+    default_score = settings.IP_REPUTATION_DEFAULT_SCORE if default_score is None else default_score
+    starts, ends, scores = [], [], []
+    for path in paths:
+        for start, end, score in parse_feed_file(path, default_score):
+            starts.append(start)
+            ends.append(end)
+            scores.append(score)
+    return IPReputationIndex.from_ranges(np.array(starts, dtype=np.int64),
+                                         np.array(ends, dtype=np.int64),
+                                         np.array(scores, dtype=np.float64))
+
+_index: Optional[IPReputationIndex] = None
+_signature: Optional[Tuple] = None
+_checked_at: Optional[float] = None
+_index_lock = threading.Lock()
+
+def _recently_checked() -> bool:
+    return _checked_at is not None and time.monotonic() - _checked_at < settings.IP_REPUTATION_REFRESH_SECONDS
+
+def get_ip_index() -> Optional[IPReputationIndex]:
+    """
+    Retourne l'index local courant, reconstruit si les feeds ont changé.
+    La vérification a lieu au plus toutes les IP_REPUTATION_REFRESH_SECONDS ;
+    le nouvel index remplace l'ancien d'un seul coup, les lectures en cours
+    gardent l'ancien. Des feeds invalides ne sont pas relus avant d'avoir changé.
+    """
+    global _index, _signature, _checked_at
+    if not settings.IP_REPUTATION_FEEDS_DIR:
+        return None
+    if _recently_checked():
+        return _index
+
+    with _index_lock:
+        if _recently_checked():
+            return _index
+        paths = feed_files(settings.IP_REPUTATION_FEEDS_DIR)
+        signature = feeds_signature(paths)
+        if signature != _signature:
+            try:
+                start = time.perf_counter()
+                index = build_index(paths)
+                _index, _signature = index, signature
+                logger.info(f"Index de réputation IP reconstruit: {len(index)} intervalles, "
+                            f"{len(paths)} feeds en {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                # L'ancien index reste en service ; signature mémorisée pour ne pas
+                # relire les mêmes feeds à chaque scoring
+                _signature = signature
+                logger.error(f"Erreur lors de la construction de l'index de réputation IP: {e}")
+        _checked_at = time.monotonic()
+    return _index
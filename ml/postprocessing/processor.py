@@ -2,11 +2,14 @@ import pandas as pd
 import numpy as np
 import logging
 import json
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime
 from core.config import settings
-from .scoring import calculate_criticality_score, categorize_criticality
-from .reporting import build_json_report
+from .scoring import RunningScoreBounds, calculate_criticality_score, categorize_criticality
+from .reporting import (
+    build_json_report, build_file_summaries, build_empty_report,
+    build_report_header, prepare_report_frame, iter_incidents
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +18,23 @@ class IncidentProcessor:
     Classe pour traiter les incidents déjà prédits et générer des rapports JSON
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, group: Optional[bool] = None,
+                 group_keys: Optional[List[str]] = None,
+                 score_bounds: Optional[RunningScoreBounds] = None):
         """
         Initialise le processeur d'incidents
         
         Args:
             api_key: Clé API AbuseIPDB (optionnelle)
+            group: Regrouper les incidents identiques (INCIDENT_GROUPING par défaut)
+            group_keys: Colonnes de regroupement (INCIDENT_GROUP_KEYS par défaut)
+            score_bounds: Bornes de normalisation partagées entre appels (flux
+                          d'ingestion) ; par défaut normalisation sur chaque appel
         """
         self.api_key = api_key or settings.ABUSEIPDB_KEY
+        self.group = settings.INCIDENT_GROUPING if group is None else group
+        self.group_keys = group_keys or settings.INCIDENT_GROUP_KEYS
+        self.score_bounds = score_bounds
         
     def extract_incidents(self, X: pd.DataFrame, y_pred: np.ndarray) -> pd.DataFrame:
         """
@@ -52,16 +64,59 @@ class IncidentProcessor:
             
         return df_incidents
     
-    def generate_incident_report(self, X: pd.DataFrame, y_pred: np.ndarray) -> Dict[str, Any]:
+    def group_incidents(self, df_scored: pd.DataFrame) -> pd.DataFrame:
         """
-        Génère un rapport d'incidents complet en JSON
+        Regroupe les incidents identiques sur les colonnes de regroupement
+        
+        Chaque groupe est représenté par son occurrence la plus critique (même
+        ordre que sort_incidents) : score, description, IP, ports et horodatage
+        sont ceux de cette occurrence, le score du groupe est donc le maximum des
+        scores de ses occurrences. S'y ajoutent le nombre d'occurrences
+        (occurrence_count) et le premier et le dernier created_time (first_seen,
+        last_seen). Les lignes conservent l'ordre d'origine.
+        
+        Args:
+            df_scored: DataFrame des incidents scorés et catégorisés, une ligne par occurrence
+            
+        Returns:
+            DataFrame des incidents regroupés
+        """
+        keys = [col for col in self.group_keys if col in df_scored.columns]
+        # Les analyses par lot ne regroupent jamais des incidents de fichiers différents
+        if 'source_file' in df_scored.columns:
+            keys.append('source_file')
+        if not keys or df_scored.empty:
+            return df_scored
+        
+        df = df_scored.assign(_position=np.arange(len(df_scored)))
+        if 'created_time' in df.columns:
+            df['_created'] = pd.to_datetime(df['created_time'], errors='coerce')
+        ranked = df.sort_values(['criticality_order', 'composite_score', '_position'],
+                                ascending=[False, False, True], kind='stable')
+        groups = ranked.groupby(keys, dropna=False, sort=False)
+        ranked['occurrence_count'] = groups['_position'].transform('size')
+        if '_created' in ranked.columns:
+            for col, func in (('first_seen', 'min'), ('last_seen', 'max')):
+                ranked[col] = groups['_created'].transform(func).map(
+                    lambda value: value.isoformat() if pd.notna(value) else None)
+        
+        # Première ligne de chaque groupe dans l'ordre de criticité = occurrence représentative
+        df_grouped = ranked.groupby(keys, dropna=False, sort=False).head(1).sort_values('_position')
+        logger.info(f"{len(df_scored)} incidents regroupés en {len(df_grouped)} groupes")
+        return df_grouped.drop(columns=[col for col in ('_position', '_created') if col in df_grouped.columns])
+    
+    def score_incidents(self, X: pd.DataFrame, y_pred: np.ndarray, sort: bool = True) -> pd.DataFrame:
+        """
+        Extrait, score et trie les incidents prédits
         
         Args:
             X: DataFrame original des données
             y_pred: Array des prédictions (0 ou 1)
+            sort: Trier tous les incidents (inutile si seul le top-K est retenu)
             
         Returns:
-            Dictionnaire JSON du rapport d'incidents
+            DataFrame des incidents triés par criticité et score composite
+            (vide si aucun incident)
         """
         # 1. Extraction des incidents
         logger.info("Extraction des incidents prédits...")
@@ -69,51 +124,154 @@ class IncidentProcessor:
         logger.info(f"Nombre d'incidents extraits: {len(df_incidents)}")
         
         if df_incidents.empty:
-            return {
-                "status": "success",
-                "timestamp": datetime.now().isoformat(),
-                "summary": {
-                    "total_incidents": 0,
-                    "critical_count": 0,
-                    "high_count": 0,
-                    "medium_count": 0,
-                    "low_count": 0,
-                    "info_count": 0
-                },
-                "incidents": [],
-                "analytics": {
-                    "top_ioc_types": {},
-                    "top_hosts": {},
-                    "top_feeds": {}
-                }
-            }
+            return df_incidents
         
         # 2. Calcul des scores de criticité
         logger.info("Calcul des scores de criticité..")
-        df_scored = calculate_criticality_score(df_incidents, self.api_key)
+        df_scored = calculate_criticality_score(df_incidents, self.api_key, self.score_bounds)
         df_final = categorize_criticality(df_scored)
         
+        # Regroupement des incidents identiques, après un scoring par occurrence
+        if self.group:
+            df_final = self.group_incidents(df_final)
+        
+        if not sort:
+            return df_final
+        
         # 3. Tri par criticité et score
         logger.info("Tri des incidents par criticité et score composite...")
-        df_sorted = df_final.sort_values(
+        return self.sort_incidents(df_final)
+
+    @staticmethod
+    def sort_incidents(df_final: pd.DataFrame) -> pd.DataFrame:
+        """Trie tous les incidents par criticité et score composite (tri stable)"""
+        return df_final.sort_values(
             ['criticality_order', 'composite_score'], 
             ascending=[False, False]
         )
+
+    @staticmethod
+    def select_top_k(df_final: pd.DataFrame, k: int) -> pd.DataFrame:
+        """
+        Sélectionne les K incidents les plus critiques sans trier tout le DataFrame
+        
+        Sélection partielle en O(n) puis tri des K lignes retenues. L'ordre obtenu
+        est identique aux K premières lignes de sort_incidents (à égalité, la
+        position d'origine départage).
+        
+        Args:
+            df_final: DataFrame des incidents scorés et catégorisés
+            k: Nombre d'incidents à retenir
+            
+        Returns:
+            DataFrame des K incidents triés
+        """
+        if k >= len(df_final):
+            return IncidentProcessor.sort_incidents(df_final)
+        if k <= 0:
+            return df_final.iloc[:0]
+        
+        # Clé unique : composite_score est dans [0, 1] et criticality_order
+        # en découle, un écart de 2 entre niveaux préserve l'ordre lexicographique.
+        # Les scores NaN (niveau INFO) sont placés en dernier comme dans sort_values.
+        order = df_final['criticality_order'].to_numpy(dtype=float)
+        score = np.nan_to_num(df_final['composite_score'].to_numpy(dtype=float), nan=-1.0)
+        key = order * 2 + score
+        
+        kth = -np.partition(-key, k - 1)[k - 1]
+        above = np.flatnonzero(key > kth)
+        ties = np.flatnonzero(key == kth)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+        selected = selected[np.lexsort((selected, -key[selected]))]
+        return df_final.iloc[selected]
+
+    def generate_incident_report(self, X: pd.DataFrame, y_pred: np.ndarray,
+                                 top_k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Génère un rapport d'incidents complet en JSON
+        
+        Args:
+            X: DataFrame original des données
+            y_pred: Array des prédictions (0 ou 1)
+            top_k: Ne construire que les K incidents les plus critiques
+                   (summary et analytics restent calculés sur tous les incidents)
+            
+        Returns:
+            Dictionnaire JSON du rapport d'incidents
+        """
+        df_scored = self.score_incidents(X, y_pred, sort=top_k is None)
+        return self.build_report(df_scored, X, top_k=top_k)
+
+    def build_report(self, df_scored: pd.DataFrame, X: pd.DataFrame,
+                     top_k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Construit le rapport JSON à partir des incidents scorés
+        
+        Args:
+            df_scored: DataFrame des incidents scorés (trié si top_k est None)
+            X: DataFrame original des données
+            top_k: Ne construire que les K incidents les plus critiques
+            
+        Returns:
+            Dictionnaire JSON du rapport d'incidents
+        """
+        if df_scored.empty:
+            return self._add_file_summaries(build_empty_report(), df_scored, X)
         
         # 4. Génération du rapport JSON
         logger.info("Génération du rapport JSON...")
-        report = build_json_report(df_sorted, api_used=bool(self.api_key))
+        if top_k is None:
+            report = build_json_report(df_scored, api_used=bool(self.api_key))
+        else:
+            df_top = self.select_top_k(df_scored, top_k)
+            report = build_json_report(df_scored, api_used=bool(self.api_key), df_incidents=df_top)
+            report["metadata"]["top_k"] = top_k
         logger.info(f"Rapport généré avec succes")
+        return self._add_file_summaries(report, df_scored, X)
+
+    def stream_incident_report(self, X: pd.DataFrame,
+                               y_pred: np.ndarray) -> Tuple[Dict[str, Any], Callable[[], Iterator[Dict[str, Any]]]]:
+        """
+        Prépare un rapport diffusé en flux : le scoring et l'en-tête (summary,
+        analytics) sont calculés immédiatement, les incidents sont générés
+        paresseusement dans l'ordre de criticité
+        
+        Args:
+            X: DataFrame original des données
+            y_pred: Array des prédictions (0 ou 1)
+            
+        Returns:
+            Tuple (en-tête du rapport, fonction retournant un nouvel itérateur
+            des incidents, pour la réponse et pour l'enregistrement)
+        """
+        df_sorted = self.score_incidents(X, y_pred)
+        
+        if df_sorted.empty:
+            header = build_empty_report()
+            del header["incidents"]
+            return self._add_file_summaries(header, df_sorted, X), lambda: iter(())
+        
+        df_clean = prepare_report_frame(df_sorted)
+        header = build_report_header(df_clean, len(df_sorted), api_used=bool(self.api_key))
+        return self._add_file_summaries(header, df_sorted, X), lambda: iter_incidents(df_clean)
+
+    def _add_file_summaries(self, report: Dict[str, Any], df_sorted: pd.DataFrame,
+                            X: pd.DataFrame) -> Dict[str, Any]:
+        """Ajoute les résumés par fichier source pour les analyses par lot"""
+        if 'source_file' in X.columns:
+            report["files"] = build_file_summaries(df_sorted, X['source_file'])
         return report
 
 def generate_incident_report_json(X: pd.DataFrame, y_pred: np.ndarray, 
                                 api_key: Optional[str] = None, 
-                                output_file: Optional[str] = None) -> Dict[str, Any]:
+                                output_file: Optional[str] = None,
+                                top_k: Optional[int] = None,
+                                group: Optional[bool] = None) -> Dict[str, Any]:
     """
     Fonction utilitaire pour générer un rapport d'incidents en JSON
     """
-    processor = IncidentProcessor(api_key)
-    report = processor.generate_incident_report(X, y_pred)
+    processor = IncidentProcessor(api_key, group=group)
+    report = processor.generate_incident_report(X, y_pred, top_k=top_k)
     
     if output_file:
         with open(output_file, 'w', encoding='utf-8') as f:
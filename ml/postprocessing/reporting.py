@@ -1,93 +1,195 @@
 import pandas as pd
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
-def build_json_report(df_sorted: pd.DataFrame, api_used: bool = False) -> Dict[str, Any]:
-    """Construit le rapport JSON final"""
-    
-    # Remplacement des NaN par des valeurs par défaut
+def count_values(df_clean: pd.DataFrame, column: str) -> pd.Series:
+    """Compte les incidents par valeur d'une colonne, en tenant compte des occurrences des groupes"""
+    if 'occurrence_count' in df_clean.columns:
+        return df_clean.groupby(column)['occurrence_count'].sum().sort_values(ascending=False, kind='stable')
+    return df_clean[column].value_counts()
+
+def build_summary(df_clean: pd.DataFrame) -> Dict[str, int]:
+    """Compte les incidents par niveau de criticité"""
+    levels = count_values(df_clean, 'criticality_level')
+    summary = {
+        "total_incidents": int(levels.sum()),
+        "critical_count": int(levels.get('CRITIQUE', 0)),
+        "high_count": int(levels.get('ELEVE', 0)),
+        "medium_count": int(levels.get('MOYEN', 0)),
+        "low_count": int(levels.get('FAIBLE', 0)) + int(levels.get('INFO', 0)),
+        #"info_count": int(levels.get('INFO', 0))
+    }
+    # Nombre d'entrées du rapport lorsque les incidents sont regroupés
+    if 'occurrence_count' in df_clean.columns:
+        summary["unique_incidents"] = len(df_clean)
+    return summary
+
+def build_file_summaries(df_sorted: pd.DataFrame, source_files: pd.Series) -> List[Dict[str, Any]]:
+    """
+    Construit un résumé par fichier source pour les analyses par lot
+
+    Args:
+        df_sorted: DataFrame des incidents scorés (colonne source_file)
+        source_files: Fichier source de chaque ligne analysée
+    """
+    rows_processed = source_files.value_counts()
+    summaries = []
+    for name in pd.unique(source_files):
+        if df_sorted.empty:
+            df_file = pd.DataFrame({'criticality_level': []})
+        else:
+            df_file = df_sorted[df_sorted['source_file'] == name]
+        summary = build_summary(df_file.fillna({'criticality_level': 'INFO'}))
+        summaries.append({
+            "fileName": str(name),
+            "rows_processed": int(rows_processed.get(name, 0)),
+            **summary
+        })
+    return summaries
+
+def build_empty_report() -> Dict[str, Any]:
+    """Rapport retourné lorsqu'aucun incident n'est prédit"""
+    return {
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "summary": {
+            "total_incidents": 0,
+            "critical_count": 0,
+            "high_count": 0,
+            "medium_count": 0,
+            "low_count": 0,
+            "info_count": 0
+        },
+        "incidents": [],
+        "analytics": {
+            "top_ioc_types": {},
+            "top_hosts": {},
+            "top_feeds": {}
+        }
+    }
+
+def prepare_report_frame(df_sorted: pd.DataFrame) -> pd.DataFrame:
+    """Remplace les NaN par des valeurs par défaut avant la construction du rapport"""
     logger.info("Remplacement des NaN par des valeurs par défaut...")
-    df_clean = df_sorted.fillna({
+    return df_sorted.fillna({
         'hostname': 'Unknown',
         'ioc_type': 'Unknown',
         'description': 'No description',
         'feed_name': 'Unknown',
         'criticality_level': 'INFO'
     })
+
+def build_analytics(df_clean: pd.DataFrame) -> Dict[str, Any]:
+    """Calcule les analytics (top IOC, hôtes, feeds et distribution)"""
+    logger.info("Calcul des analytics...")
+    return {
+        "top_ioc_types": count_values(df_clean, 'ioc_type').head().to_dict(),
+        "top_hosts": count_values(df_clean, 'hostname').head().to_dict(),
+        "top_feeds": count_values(df_clean, 'feed_name').head().to_dict(),
+        "criticality_distribution": count_values(df_clean, 'criticality_level').to_dict()
+    }
+
+def build_incident(row: pd.Series, position: int) -> Dict[str, Any]:
+    """Construit l'objet incident d'une ligne (position = rang dans le tri, à partir de 1)"""
+    incident = {
+        "id": f"INC_{position:06d}",
+        "criticality_level": row.get('criticality_level', 'INFO'),
+        "composite_score": round(float(row.get('composite_score', 0)), 3),
+        "timestamp": datetime.now().isoformat(),
+        "details": {
+            "created_time": row.get('created_time', "Unknown"),
+            "hostname": str(row.get('hostname', 'Unknown')),
+            "internal_ip": str(row.get('internal_ip', 'Unknown')),
+            "ioc_type": str(row.get('ioc_type', 'Unknown')),
+            "ioc_value": str(row.get('ioc_value', 'Unknown')),
+            "description": str(row.get('description', 'No description')),
+            "feed_name": str(row.get('feed_name', 'Unknown')),
+            "os_type": str(row.get('os_type', 'Unknown')),
+        },
+        "scores": {
+            "criticality_score": round(float(row.get('final_criticality_score', 0)), 2),
+            "contextual_score": round(float(row.get('contextual_score', 0)), 2),
+            "ip_reputation_score": round(float(row.get('ip_reputation_score', 0)), 2)
+        }
+    }
+    
+    # Ajout des attributs réseau si disponibles
+    network_attrs = {}
+    for attr in ['ioc_attr_remote_ip', 'ioc_attr_direction', 'ioc_attr_remote_port']:
+        if attr in row and pd.notna(row[attr]):
+            network_attrs[attr.replace('ioc_attr_', '')] = str(row[attr])
     
-    # Calcul des statistiques
+    if network_attrs:
+        incident["details"]["network"] = network_attrs
+
+    # Occurrences des incidents regroupés
+    if 'occurrence_count' in row:
+        incident["occurrences"] = int(row['occurrence_count'])
+        incident["details"]["first_seen"] = row.get('first_seen')
+        incident["details"]["last_seen"] = row.get('last_seen')
+
+    # Fichier source pour les analyses par lot
+    if 'source_file' in row:
+        incident["source_file"] = str(row['source_file'])
+    
+    return incident
+
+def iter_incidents(df_clean: pd.DataFrame, start: int = 1) -> Iterator[Dict[str, Any]]:
+    """Génère paresseusement les incidents dans l'ordre du DataFrame"""
+    for position, (idx, row) in enumerate(df_clean.iterrows(), start=start):
+        yield build_incident(row, position)
+
+def build_report_header(df_clean: pd.DataFrame, total_processed: int,
+                        api_used: bool = False) -> Dict[str, Any]:
+    """Construit l'en-tête du rapport (tout sauf la liste des incidents)"""
     logger.info("Calcul des statistiques...")
-    summary = {
-        "total_incidents": len(df_clean),
-        "critical_count": len(df_clean[df_clean['criticality_level'] == 'CRITIQUE']),
-        "high_count": len(df_clean[df_clean['criticality_level'] == 'ELEVE']),
-        "medium_count": len(df_clean[df_clean['criticality_level'] == 'MOYEN']),
-        "low_count": (len(df_clean[df_clean['criticality_level'] == 'FAIBLE']) + len(df_clean[df_clean['criticality_level'] == 'INFO'])),
-        #"info_count": len(df_clean[df_clean['criticality_level'] == 'INFO'])
+    return {
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "summary": build_summary(df_clean),
+        "analytics": build_analytics(df_clean),
+        "metadata": {
+            "total_processed": total_processed,
+            "api_used": api_used
+        }
     }
+
+def build_json_report(df_sorted: pd.DataFrame, api_used: bool = False,
+                      df_incidents: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    Construit le rapport JSON final
+
+    Args:
+        df_sorted: DataFrame de tous les incidents scorés (summary et analytics)
+        api_used: Indique si l'API de réputation a été utilisée
+        df_incidents: Sous-ensemble trié des incidents à matérialiser
+                      (par défaut tous les incidents de df_sorted)
+    """
+    
+    df_clean = prepare_report_frame(df_sorted)
+    header = build_report_header(df_clean, len(df_sorted), api_used)
     
     # Conversion des incidents en liste de dictionnaires
     logger.info("Conversion des incidents en liste de dictionnaires...")
-    incidents = []
-    for idx, row in df_clean.iterrows():
-        incident = {
-            "id": f"INC_{len(incidents)+1:06d}",
-            "criticality_level": row.get('criticality_level', 'INFO'),
-            "composite_score": round(float(row.get('composite_score', 0)), 3),
-            "timestamp": datetime.now().isoformat(),
-            "details": {
-                "created_time": row.get('created_time', "Unknown"),
-                "hostname": str(row.get('hostname', 'Unknown')),
-                "internal_ip": str(row.get('internal_ip', 'Unknown')),
-                "ioc_type": str(row.get('ioc_type', 'Unknown')),
-                "ioc_value": str(row.get('ioc_value', 'Unknown')),
-                "description": str(row.get('description', 'No description')),
-                "feed_name": str(row.get('feed_name', 'Unknown')),
-                "os_type": str(row.get('os_type', 'Unknown')),
-            },
-            "scores": {
-                "criticality_score": round(float(row.get('final_criticality_score', 0)), 2),
-                "contextual_score": round(float(row.get('contextual_score', 0)), 2),
-                "ip_reputation_score": round(float(row.get('ip_reputation_score', 0)), 2)
-            }
-        }
-        
-        # Ajout des attributs réseau si disponibles
-        network_attrs = {}
-        for attr in ['ioc_attr_remote_ip', 'ioc_attr_direction', 'ioc_attr_remote_port']:
-            if attr in row and pd.notna(row[attr]):
-                network_attrs[attr.replace('ioc_attr_', '')] = str(row[attr])
-        
-        if network_attrs:
-            incident["details"]["network"] = network_attrs
-        
-        incidents.append(incident)
-    
-    # Analytics
-    logger.info("Calcul des analytics...")
-    analytics = {
-        "top_ioc_types": df_clean['ioc_type'].value_counts().head().to_dict(),
-        "top_hosts": df_clean['hostname'].value_counts().head().to_dict(),
-        "top_feeds": df_clean['feed_name'].value_counts().head().to_dict(),
-        "criticality_distribution": df_clean['criticality_level'].value_counts().to_dict()
-    }
+    if df_incidents is None:
+        incidents = list(iter_incidents(df_clean))
+    else:
+        incidents = list(iter_incidents(prepare_report_frame(df_incidents)))
+        header["metadata"]["incidents_returned"] = len(incidents)
 
     # Construction du rapport final
     logger.info("Construction du rapport final...")
     report = {
         #"_id": f"{uuid4()}",
-        "status": "success",
-        "timestamp": datetime.now().isoformat(),
-        "summary": summary,
+        "status": header["status"],
+        "timestamp": header["timestamp"],
+        "summary": header["summary"],
         "incidents": incidents,
-        "analytics": analytics,
-        "metadata": {
-            "total_processed": len(df_sorted),
-            "api_used": api_used
-        }
+        "analytics": header["analytics"],
+        "metadata": header["metadata"]
     }
     
     return report
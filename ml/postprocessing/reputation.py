@@ -1,6 +1,9 @@
 import requests
+import numpy as np
 import pandas as pd
 import logging
+from core.config import settings
+from .ip_index import get_ip_index
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +23,7 @@ def check_ip_reputation(ip: str, api_key: str, max_age_days: int = 90) -> float:
         return 0
     
     try:
-        url = 'https://api.abuseipdb.com/api/v2/check'
+        url = settings.ABUSEIPDB_URL
         headers = {
             'Accept': 'application/json',
             'Key': api_key
@@ -51,3 +54,33 @@ def check_ip_reputation(ip: str, api_key: str, max_age_days: int = 90) -> float:
     except Exception as e:
         logger.warning(f"Erreur vérification IP {ip}: {e}")
         return 0
+
+def score_ip_column(ips: pd.Series, api_key: str) -> pd.Series:
+    """
+    Score de réputation (0-10) de chaque IP d'une colonne
+
+    L'index local (IP_REPUTATION_FEEDS_DIR) résout toute la colonne en une seule
+    recherche vectorisée. Selon IP_REPUTATION_MODE, les IP absentes de l'index
+    sont ensuite vérifiées auprès d'AbuseIPDB (local_first), ou notées 0
+    (local_only) ; remote_only n'utilise que l'API. Chaque IP distincte n'est
+    interrogée qu'une seule fois.
+
+    Args:
+        ips: Série d'adresses IP
+        api_key: Clé API AbuseIPDB
+    """
+    mode = settings.IP_REPUTATION_MODE
+    scores = pd.Series(np.nan, index=ips.index)
+
+    if mode != 'remote_only':
+        index = get_ip_index()
+        if index is not None:
+            scores[:] = index.lookup(ips)
+
+    if mode != 'local_only':
+        remaining = scores.isna() & ips.notna()
+        if remaining.any():
+            remote_scores = {ip: check_ip_reputation(ip, api_key) for ip in ips[remaining].unique()}
+            scores[remaining] = ips[remaining].map(remote_scores)
+
+    return scores.fillna(0)
@@ -1,10 +1,38 @@
 import pandas as pd
 import numpy as np
-from .reputation import check_ip_reputation
+from typing import Optional
+from .reputation import score_ip_column
 
-def calculate_criticality_score(df_incidents: pd.DataFrame, api_key: str = None) -> pd.DataFrame:
+class RunningScoreBounds:
+    """
+    Bornes min/max des scores bruts conservées d'un micro-batch à l'autre (une
+    instance par flux d'ingestion), pour que la normalisation ne dépende pas de
+    la composition de chaque micro-batch : une alerte seule n'est plus ramenée
+    à 0.5. Les bornes partent d'une échelle de référence et s'élargissent avec
+    les scores observés.
+    """
+
+    # Échelle de référence : type d'IOC + activité système / feeds + mots-clés + réputation
+    REFERENCE = {'criticality_score': (0.0, 60.0), 'contextual_score': (0.0, 50.0)}
+
+    def __init__(self):
+        self.bounds = dict(self.REFERENCE)
+
+    def normalize(self, df: pd.DataFrame, column: str) -> pd.Series:
+        """Élargit les bornes avec les scores du batch puis normalise dans [0, 1]"""
+        low, high = self.bounds[column]
+        if df[column].notna().any():
+            low, high = min(low, df[column].min()), max(high, df[column].max())
+            self.bounds[column] = (low, high)
+        return (df[column] - low) / (high - low)
+
+def calculate_criticality_score(df_incidents: pd.DataFrame, api_key: str = None,
+                                score_bounds: Optional[RunningScoreBounds] = None) -> pd.DataFrame:
     """
     Calcule un score de criticité complet combinant multiples facteurs
+
+    Sans score_bounds, la normalisation min-max est faite sur df_incidents ;
+    avec, elle utilise les bornes conservées d'un appel à l'autre (micro-batches).
     """
     df = df_incidents.copy()
     
@@ -83,9 +111,7 @@ def calculate_criticality_score(df_incidents: pd.DataFrame, api_key: str = None)
         if col in df.columns:
             ip_mask = df[col].notna()
             if ip_mask.any():
-                df.loc[ip_mask, 'ip_reputation_score'] = df.loc[ip_mask, col].apply(
-                    lambda ip: check_ip_reputation(ip, api_key)
-                )
+                df.loc[ip_mask, 'ip_reputation_score'] = score_ip_column(df.loc[ip_mask, col], api_key)
                 df['contextual_score'] += df['ip_reputation_score']
     
     ## 6. Facteurs environnementaux
@@ -119,17 +145,21 @@ def calculate_criticality_score(df_incidents: pd.DataFrame, api_key: str = None)
     
     ## 7. Normalisation et score composite
     # Normalisation min-max
-    if df['criticality_score'].max() > df['criticality_score'].min():
-        df['criticality_norm'] = (df['criticality_score'] - df['criticality_score'].min()) / \
-                               (df['criticality_score'].max() - df['criticality_score'].min())
-    else:
-        df['criticality_norm'] = 0.5
-        
-    if df['contextual_score'].max() > df['contextual_score'].min():
-        df['contextual_norm'] = (df['contextual_score'] - df['contextual_score'].min()) / \
-                              (df['contextual_score'].max() - df['contextual_score'].min())
+    if score_bounds is not None:
+        df['criticality_norm'] = score_bounds.normalize(df, 'criticality_score')
+        df['contextual_norm'] = score_bounds.normalize(df, 'contextual_score')
     else:
-        df['contextual_norm'] = 0.5
+        if df['criticality_score'].max() > df['criticality_score'].min():
+            df['criticality_norm'] = (df['criticality_score'] - df['criticality_score'].min()) / \
+                                   (df['criticality_score'].max() - df['criticality_score'].min())
+        else:
+            df['criticality_norm'] = 0.5
+            
+        if df['contextual_score'].max() > df['contextual_score'].min():
+            df['contextual_norm'] = (df['contextual_score'] - df['contextual_score'].min()) / \
+                                  (df['contextual_score'].max() - df['contextual_score'].min())
+        else:
+            df['contextual_norm'] = 0.5
     
     # Score composite pondéré
     df['composite_score'] = (df['criticality_norm'] * 0.7) + (df['contextual_norm'] * 0.3)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from ml.postprocessing.processor import IncidentProcessor
+
+
+def _alert(hostname, description, created_time):
+    return {
+        'hostname': hostname, 'ioc_value': 'ioc', 'process_name': 'cmd.exe',
+        'description': description, 'created_time': created_time,
+        'ioc_type': 'md5', 'feed_name': 'SANS', 'netconn_count': 1,
+    }
+
+
+def _report(X, group):
+    return IncidentProcessor(None, group=group).generate_incident_report(X, np.ones(len(X), dtype=bool))
+
+
+def _total_score(incident):
+    return incident['scores']['criticality_score'] + incident['scores']['contextual_score']
+
+
+def test_group_is_represented_by_its_most_critical_occurrence():
+    X = pd.DataFrame([
+        _alert('h1', 'normal', '2025-01-01 12:00:00'),
+        _alert('h1', 'ransomware apt c2', '2025-01-01 23:00:00'),
+        _alert('h2', 'trojan', '2025-01-01 12:00:00'),
+    ])
+
+    flat = {inc['details']['description']: inc for inc in _report(X, group=False)['incidents']}
+    grouped = _report(X, group=True)['incidents']
+
+    assert len(grouped) == 2
+    top = grouped[0]
+    assert top['details']['hostname'] == 'h1'
+    assert top['details']['description'] == 'ransomware apt c2'
+    assert top['occurrences'] == 2
+    assert top['details']['first_seen'] == '2025-01-01T12:00:00'
+    assert top['details']['last_seen'] == '2025-01-01T23:00:00'
+    # Le score du groupe est celui de son occurrence la plus critique
+    assert _total_score(top) == _total_score(flat['ransomware apt c2'])
+    assert _total_score(top) > _total_score(grouped[1])
+
+
+def test_summary_counts_occurrences():
+    X = pd.DataFrame([
+        _alert('h1', 'normal', '2025-01-01 12:00:00'),
+        _alert('h1', 'ransomware apt c2', '2025-01-01 23:00:00'),
+        _alert('h2', 'trojan', '2025-01-01 12:00:00'),
+    ])
+
+    summary = _report(X, group=True)['summary']
+
+    assert summary['total_incidents'] == 3
+    assert summary['unique_incidents'] == 2
@@ -0,0 +1,73 @@
+import ipaddress
+
+import numpy as np
+import pandas as pd
+
+from core.config import settings
+from ml.postprocessing import ip_index
+from ml.postprocessing.ip_index import IPReputationIndex
+
+
+def _brute_force(starts, ends, scores, address):
+    covering = [score for start, end, score in zip(starts, ends, scores) if start <= address <= end]
+    return max(covering) if covering else np.nan
+
+
+def test_overlapping_ranges_match_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = int(rng.integers(1, 30))
+        starts = rng.integers(0, 200, n)
+        ends = starts + rng.integers(0, 40, n)
+        scores = rng.integers(0, 11, n).astype(float)
+        index = IPReputationIndex.from_ranges(starts, ends, scores)
+
+        assert np.all(index.starts[1:] > index.ends[:-1])
+        addresses = np.arange(0, 260)
+        ips = pd.Series([str(ipaddress.IPv4Address(int(a))) for a in addresses])
+        expected = [_brute_force(starts, ends, scores, a) for a in addresses]
+        np.testing.assert_array_equal(index.lookup(ips), expected)
+
+
+def test_lookup_edge_cases():
+    index = IPReputationIndex.from_ranges(
+        np.array([0, int(ipaddress.IPv4Address('10.0.0.0')), 2**32 - 1]),
+        np.array([0, int(ipaddress.IPv4Address('10.0.0.255')), 2**32 - 1]),
+        np.array([1.0, 7.0, 9.0]),
+    )
+    ips = pd.Series(['0.0.0.0', '10.0.0.42', ' 10.0.0.255 ', '10.0.1.0', '255.255.255.255',
+                     '256.1.1.1', '10.0.0', 'not an ip', '::1', None, np.nan, ''])
+
+    result = index.lookup(ips)
+
+    np.testing.assert_array_equal(result[:5], [1.0, 7.0, 7.0, np.nan, 9.0])
+    assert np.isnan(result[5:]).all()
+
+
+def test_empty_index_returns_nan():
+    index = IPReputationIndex.from_ranges(np.array([]), np.array([]), np.array([]))
+    assert np.isnan(index.lookup(pd.Series(['1.2.3.4']))).all()
+
+
+def test_failed_build_is_not_retried_until_feeds_change(tmp_path, monkeypatch):
+    (tmp_path / 'feed.txt').write_text('1.2.3.4\n')
+    calls = []
+
+    def failing_build(paths):
+        calls.append(paths)
+        raise ValueError('feed invalide')
+
+    monkeypatch.setattr(settings, 'IP_REPUTATION_FEEDS_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'IP_REPUTATION_REFRESH_SECONDS', 0)
+    monkeypatch.setattr(ip_index, 'build_index', failing_build)
+    monkeypatch.setattr(ip_index, '_index', None)
+    monkeypatch.setattr(ip_index, '_signature', None)
+    monkeypatch.setattr(ip_index, '_checked_at', None)
+
+    assert ip_index.get_ip_index() is None
+    assert ip_index.get_ip_index() is None
+    assert len(calls) == 1
+
+    (tmp_path / 'feed.txt').write_text('1.2.3.4\n5.6.7.8\n')
+    ip_index.get_ip_index()
+    assert len(calls) == 2
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from ml.postprocessing.scoring import RunningScoreBounds, calculate_criticality_score
+
+
+def _alert(description, ioc_type='md5'):
+    return pd.DataFrame([{
+        'description': description, 'ioc_type': ioc_type, 'feed_name': 'SANS',
+        'created_time': '2025-01-01 12:00:00', 'netconn_count': 1,
+    }])
+
+
+def test_single_record_batches_are_not_flattened_to_the_midpoint():
+    bounds = RunningScoreBounds()
+    benign = calculate_criticality_score(_alert('normal', 'query'), score_bounds=bounds)
+    critical = calculate_criticality_score(_alert('ransomware apt c2'), score_bounds=bounds)
+
+    assert benign['composite_score'].iloc[0] != 0.5
+    assert critical['composite_score'].iloc[0] > benign['composite_score'].iloc[0]
+
+
+def test_running_bounds_widen_and_stay_in_unit_range():
+    bounds = RunningScoreBounds()
+    batch = pd.concat([_alert('normal', 'query'), _alert('ransomware apt c2 trojan backdoor')])
+    scored = calculate_criticality_score(batch, score_bounds=bounds)
+
+    assert scored['composite_score'].between(0, 1).all()
+    low, high = bounds.bounds['contextual_score']
+    assert low <= scored['contextual_score'].min() and high >= scored['contextual_score'].max()